@@ -0,0 +1,65 @@
+"""Micro-benchmark for parsing the fields of large records.
+
+Builds synthetic records with many fields, and times listing the field names
+and reading every field, with the current parser and with the previous one,
+which copied the remaining content of the record for every field.
+
+Usage:
+    python benchmarks/field_parsing.py
+"""
+import os
+import sys
+import struct
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from tes_reader import Record
+
+
+def make_record(field_count: int, field_size: int) -> Record:
+    content = b''.join(b'DATA' + struct.pack('<H', field_size) + bytes(field_size) for _ in range(field_count))
+    header = struct.pack('<4sIIIQ', b'LAND', len(content), 0, 0x100, 0)
+    record = Record(0, header)
+    record.content = content
+    return record
+
+
+class CopyingField:
+    """The previous Field: it copies the data out of the content it is given."""
+    def __init__(self, content: bytes):
+        self.name = content[0:4].decode('utf-8')
+        self.size = int.from_bytes(content[4:6], 'little', signed=False)
+        self._bytes = content[6:6 + self.size]
+
+
+def parse_with_copies(content: bytes) -> list:
+    """The previous parser: every field is created from a copy of the rest of the content."""
+    field_pointers, field_sizes = [], []
+    _pos = 0
+    while _pos < len(content):
+        field = CopyingField(content[_pos:])
+        field_pointers += [_pos]
+        field_sizes += [6 + int.from_bytes(content[_pos + 4:_pos + 6], 'little', signed=False)]
+        _pos += 6 + field.size
+    return [(field.name, field._bytes) for field in
+            (CopyingField(content[_pos:_pos + size]) for _pos, size in zip(field_pointers, field_sizes))]
+
+
+def parse_with_views(record: Record) -> list:
+    del record._field_pointers  # Parse again on every run.
+    return [(field.name, field._view) for field in record]
+
+
+def main():
+    print(f"{'fields':>8} {'bytes':>10} {'copying (ms)':>14} {'views (ms)':>12} {'speed-up':>9}")
+    for field_count in (100, 1000, 5000, 20000):
+        record = make_record(field_count, 64)
+        list(record)
+        runs = 5
+        copying = min(timeit.repeat(lambda: parse_with_copies(record.content), number=1, repeat=runs))
+        views = min(timeit.repeat(lambda: parse_with_views(record), number=1, repeat=runs))
+        print(f'{field_count:>8} {len(record.content):>10} {copying * 1000:>14.2f} {views * 1000:>12.2f} {copying / views:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,9 @@ def main(filepath):
     file_name_without_extension = os.path.basename(file_path_without_extension)
     books = {}
     with ElderScrollsFileReader(filepath) as elder_scrolls_file:
-        for book_record in elder_scrolls_file['BOOK']:
-            elder_scrolls_file.load_record_content(book_record)
+        book_records = elder_scrolls_file['BOOK']
+        elder_scrolls_file.load_record_contents(book_records)
+        for book_record in book_records:
             book = Book(book_record)
             books[book.editor_id] = list(book['DESC'])[0]
             print(book.editor_id, [full_name for full_name in book['FULL']], [text for text in book['DESC']])
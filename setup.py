@@ -15,5 +15,13 @@ setup(
     url="https://github.com/sinan-ozel/tes-reader",
     author="Sinan Ozel",
     license="Creative Commons Zero v1.0 Universal",
-    packages=['tes_reader']
+    packages=['tes_reader'],
+    extras_require={
+        'numpy': ['numpy'],
+        'arrow': ['numpy', 'pyarrow'],
+        'lz4': ['lz4'],
+    },
+    entry_points={
+        'console_scripts': ['tes-reader=tes_reader.__main__:main'],
+    }
 )
\ No newline at end of file
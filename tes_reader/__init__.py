@@ -16,10 +16,22 @@ and the explanation on the Wiki page: https://en.uesp.net/wiki/Skyrim_Mod:Mod_Fi
 __version__ = '0.1.1'
 __author__ = 'Sinan Ozel'
 
+import io
 import re
 import os
+import sys
+import mmap
+import ntpath
 import zlib
+import bisect
 import struct
+import hashlib
+import fnmatch
+import tempfile
+from array import array
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque
+from collections.abc import Mapping
 from typing import Union, List
 
 # TODO: There is a faster way to check if all four characters are uppercase ASCII: AND against one particular bit.
@@ -27,6 +39,34 @@ type_regular_expression = re.compile('[A-Z_0-9]{4}')
 def is_type(alleged_type_string: str):
     return type_regular_expression.match(alleged_type_string)
 
+def _batch_by_size(buffers: list, batch_size: int) -> list:
+    """Split buffers into consecutive lists of about batch_size bytes each."""
+    batches, batch, total_size = [], [], 0
+    for buffer in buffers:
+        batch += [buffer]
+        total_size += len(buffer)
+        if total_size >= batch_size:
+            batches += [batch]
+            batch, total_size = [], 0
+    if batch:
+        batches += [batch]
+    return batches
+
+def _decompress_in_batches(buffers: list, decompress, batch_size: int, workers: int=None) -> list:
+    """Decompress each buffer with decompress, and return the contents in the same order.
+
+    The buffers are handed to a thread pool in batches of about batch_size bytes.
+    zlib and LZ4 release the GIL while they work. The number of threads is passed
+    on to ThreadPoolExecutor; use workers=0 to decompress in the calling thread."""
+    def decompress_all(batch):
+        return [decompress(buffer) for buffer in batch]
+
+    batches = _batch_by_size(buffers, batch_size)
+    if workers == 0 or len(batches) < 2:
+        return [content for batch in batches for content in decompress_all(batch)]
+    with ThreadPoolExecutor(workers) as executor:
+        return [content for batch in executor.map(decompress_all, batches) for content in batch]
+
 def debug_record_attribute(func):
     """Decorator to print debugging information about the record."""
     def func_with_debug(self, *args, **kwargs):
@@ -43,119 +83,333 @@ def debug_record_attribute(func):
 
 
 class FormId:
-    # TODO: Implement __index__
-    # TODO: Implement __format__
-    def __init__(self, byte):
-        if not isinstance(byte, (bytes, str)):
-            raise ValueError("Use a string or byte object to instantiate a Form ID.")
-        if isinstance(byte, str):
+    """A form ID: the mod index in the top byte, and the object index in the lower three bytes.
+
+    Form IDs of records in light (ESL) plugins have the mod index 0xFE. The next
+    12 bits are then the light index, the position of the plugin among the light
+    plugins in the load order, and the object index is the lowest 12 bits.
+
+    The value is kept as an int. Form IDs compare equal to, and hash like, the
+    same value as an int, so ints and form IDs can be mixed as dictionary keys.
+    They can also be compared with hexadecimal strings and little-endian bytes.
+    A form ID built from three bytes, or a short string, has no mod index.
+    """
+    __slots__ = ('_value', '_length')
+    light_mod_index = 0xFE
+    max_light_index = 0xFFF
+    max_light_object_index = 0xFFF
+
+    def __init__(self, byte: Union[bytes, str, int]):
+        if isinstance(byte, int):
+            if not 0 <= byte <= 0xFFFFFFFF:
+                raise ValueError(f"Form IDs have to fit in 4 bytes, got: {hex(byte)}")
+            self._value = byte
+            self._length = 4
+        elif isinstance(byte, str):
             if byte[:2] != '0x':
                 raise ValueError("When creating a Form ID with a string, use a hexadecimal value. For examle: FormId('0x13bab')")
-            if len(byte) > 8:
-                self._bytes = int(byte, 16).to_bytes(4, byteorder='little')
-            else:
-                self._bytes = int(byte, 16).to_bytes(3, byteorder='little')
-        else:
+            self._value = int(byte, 16)
+            self._length = 4 if len(byte) > 8 else 3
+            if self._value >> (8 * self._length):
+                raise ValueError(f"Form IDs have to fit in 4 bytes, got: {byte}")
+        elif isinstance(byte, (bytes, bytearray, memoryview)):
             if not len(byte) <= 4:
                 raise ValueError("Form IDs have to have the length 4 bytes or less.")
-            self._bytes = byte
+            self._value = int.from_bytes(byte, 'little', signed=False)
+            self._length = len(byte)
+        else:
+            raise ValueError("Use a string, int or byte object to instantiate a Form ID.")
+
+    @classmethod
+    def _from_int(cls, value: int, length: int=4) -> 'FormId':
+        """Create a form ID without validating the value."""
+        form_id = object.__new__(cls)
+        form_id._value = value
+        form_id._length = length
+        return form_id
+
+    @staticmethod
+    def _to_int(other) -> int:
+        """Return the value of something that can be compared with a form ID, or None."""
+        if isinstance(other, FormId):
+            return other._value
+        elif isinstance(other, int):
+            return other
+        elif isinstance(other, str):
+            try:
+                return int(other, 16)
+            except ValueError:
+                return None
+        elif isinstance(other, (bytes, bytearray)) and len(other) <= 4:
+            return int.from_bytes(other, 'little', signed=False)
 
     def __getitem__(self, key):
-        return self._bytes[key]
+        return bytes(self)[key]
+
+    def __bytes__(self):
+        return self._value.to_bytes(self._length, 'little')
 
     def __int__(self):
-        return int.from_bytes(self._bytes, 'little', signed=False)
+        return self._value
 
     def __index__(self):
-        return int.from_bytes(self._bytes, 'little', signed=False)
+        return self._value
 
     def __hex__(self):
-        return hex(int.from_bytes(self._bytes, 'little', signed=False))
+        return hex(self._value)
 
     def __str__(self):
-        return str(hex(int.from_bytes(self._bytes, 'little', signed=False)))
+        return hex(self._value)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self}')"
+
+    def __format__(self, format_spec):
+        if not format_spec:
+            return str(self)
+        return format(self._value, format_spec)
 
     def __len__(self):
-        return len(self._bytes)
+        return self._length
+
+    def __hash__(self):
+        return hash(self._value)
 
     def __eq__(self, other):
-        if isinstance(other, FormId):
-            return self._bytes == other._bytes
-        elif isinstance(other, str):
-            # TODO: Add unit test.
-            if other.startswith('0x'):
-                return str(self)[2:] == other[2:].lstrip('0')
-            else:
-                return str(self)[2:] == other.lstrip('0')
+        value = self._to_int(other)
+        if value is None:
+            return NotImplemented
+        return self._value == value
+
+    def __lt__(self, other):
+        value = self._to_int(other)
+        if value is None:
+            return NotImplemented
+        return self._value < value
+
+    def __le__(self, other):
+        value = self._to_int(other)
+        if value is None:
+            return NotImplemented
+        return self._value <= value
+
+    def __gt__(self, other):
+        value = self._to_int(other)
+        if value is None:
+            return NotImplemented
+        return self._value > value
+
+    def __ge__(self, other):
+        value = self._to_int(other)
+        if value is None:
+            return NotImplemented
+        return self._value >= value
 
     @property
-    def modindex(self) -> bytes:
-        if len(self) == 4:
-            return self._bytes[-1]
+    def modindex(self) -> int:
+        if self._length == 4:
+            return self._value >> 24
 
     @property
     def objectindex(self):
-        if len(self) == 4:
-            return FormId(self._bytes[:-1])
+        if self.is_light:
+            return FormId._from_int(self._value & self.max_light_object_index, 3)
+        if self._length == 4:
+            return FormId._from_int(self._value & 0xFFFFFF, 3)
         else:
             return self
 
+    @property
+    def is_light(self) -> bool:
+        return self._length == 4 and self._value >> 24 == self.light_mod_index
+
+    @property
+    def light_index(self) -> int:
+        if self.is_light:
+            return (self._value >> 12) & self.max_light_index
+
+    @classmethod
+    def from_indexes(cls, mod_index: int, object_index: int, light_index: int=None) -> 'FormId':
+        """Build a 4-byte form ID. Pass a light_index for a record in a light plugin, with the mod index 0xFE."""
+        if light_index is not None:
+            if mod_index != cls.light_mod_index:
+                raise ValueError(f'Form IDs in light plugins have the mod index 0xfe, got: {hex(mod_index)}')
+            if not 0 <= light_index <= cls.max_light_index:
+                raise ValueError(f'Light index out of range: {hex(light_index)}')
+            if not 0 <= object_index <= cls.max_light_object_index:
+                raise ValueError(f'Object index out of range for a light plugin: {hex(object_index)}')
+            object_index |= light_index << 12
+        elif not 0 <= mod_index <= 0xFF:
+            raise ValueError(f'Mod index out of range: {hex(mod_index)}')
+        elif not 0 <= object_index <= 0xFFFFFF:
+            raise ValueError(f'Object index out of range: {hex(object_index)}')
+        return cls._from_int(mod_index << 24 | object_index)
+
+    # Helpers for many form IDs at once. They take raw form IDs as ints, in an
+    # array('I'), a list, or a NumPy array, and return the same kind of sequence.
+
+    @staticmethod
+    def unpack_all(data: Union[bytes, memoryview]) -> array:
+        """Convert consecutive little-endian 4-byte form IDs, for example from a field, to an array of ints."""
+        form_ids = array('I')
+        form_ids.frombytes(data)
+        if sys.byteorder == 'big':
+            form_ids.byteswap()
+        return form_ids
+
+    @staticmethod
+    def mod_indexes(form_ids):
+        if hasattr(form_ids, 'dtype'):  # A NumPy array.
+            return form_ids >> 24
+        return array('B', [form_id >> 24 for form_id in form_ids])
+
+    @staticmethod
+    def object_indexes(form_ids):
+        if hasattr(form_ids, 'dtype'):
+            return form_ids & 0xFFFFFF
+        return array('I', [form_id & 0xFFFFFF for form_id in form_ids])
+
+    @classmethod
+    def from_ints(cls, form_ids) -> list:
+        """Wrap raw form IDs in FormId objects."""
+        from_int = cls._from_int
+        return [from_int(int(form_id)) for form_id in form_ids]
+
 
 class Field:
-    header_size = 6
+    """A field (subrecord) of a record.
 
-    def __init__(self, content: bytes):
-        assert len(content) >= self.header_size
-        self._pos = 0
-        self.name = self.get_name_from_content(content)
-        self.size = self.get_size_from_content(content)
-        self._bytes = content[self.header_size:self.header_size + self.size]
+    A field is a view on the content of its record, so creating one does not copy
+    the data. Use bytes(field) to get a copy of the data.
+    """
+    __slots__ = ('name', 'size', '_view')
+    header_size = 6
+    header_structure = struct.Struct('<4sH')
+    # An XXXX field holds the 32-bit size of the next field, for fields larger than 64 KiB.
+    oversized_field_structure = struct.Struct('<4sHI')
+    float_structure = struct.Struct('<f')
+
+    def __init__(self, content: Union[bytes, memoryview], pos: int=0):
+        name, pos, self.size = next(self.iter_headers(content, pos))
+        self.name = self.decode_name(name)
+        if not isinstance(content, memoryview):
+            content = memoryview(content)
+        self._view = content[pos + self.header_size:pos + self.header_size + self.size]
+
+    @classmethod
+    def iter_headers(cls, content: Union[bytes, memoryview], starting_position: int=0, ending_position: int=None):
+        """Iterate over the field headers in the content, yielding (name, position, size).
+
+        The name is the raw 4-byte name, the position is that of the field header,
+        and the data of the field follows the header. XXXX markers are resolved:
+        the size of the field after the marker is taken from the marker, and the
+        marker itself is not yielded. A GRUP is yielded with the size of the whole
+        group, and its contents are skipped.
+        """
+        if ending_position is None:
+            ending_position = len(content)
+        unpack_field_header = cls.header_structure.unpack_from
+        _pos = starting_position
+        while _pos < ending_position:
+            if ending_position - _pos < cls.header_size:
+                raise RuntimeError(f"Field header at position {_pos} does not fit into the record, which ends at {ending_position}")
+            name, size = unpack_field_header(content, _pos)
+            if name == b'XXXX':
+                if ending_position - _pos < cls.oversized_field_structure.size + cls.header_size:
+                    raise RuntimeError(f"XXXX field at position {_pos} is not followed by a field")
+                _, _, size = cls.oversized_field_structure.unpack_from(content, _pos)
+                _pos += cls.oversized_field_structure.size
+                name, _ = unpack_field_header(content, _pos)
+                data_size = size
+            elif name == b'GRUP':
+                size = int.from_bytes(content[_pos + 4:_pos + 8], 'little', signed=False)
+                data_size = size - cls.header_size
+            else:
+                data_size = size
+            if _pos + cls.header_size + data_size > ending_position:
+                raise RuntimeError(f"Field {name} of size {size} at position {_pos} overruns the record, which ends at {ending_position}")
+            yield name, _pos, size
+            _pos += cls.header_size + data_size
+
+    @classmethod
+    def _from_view(cls, name: str, view: memoryview):
+        field = cls.__new__(cls)
+        field.name = name
+        field.size = len(view)
+        field._view = view
+        return field
 
     @staticmethod
     def get_name_from_content(content: bytes):
+        return Field.decode_name(bytes(content[0:4]))
+
+    @staticmethod
+    def decode_name(name: bytes) -> str:
+        try:
+            return _field_names[name]
+        except KeyError:
+            pass
         # TODO: Properly determine the correct language / codepage for a file. Remove ascii.
         try:
-            return content[0:4].decode('utf-8')
+            decoded_name = name.decode('utf-8')
         except UnicodeDecodeError:
-            return content[0:4].decode('ascii')
+            decoded_name = name.decode('ascii')
+        _field_names[name] = sys.intern(decoded_name)
+        return decoded_name
 
     @staticmethod
     def get_size_from_content(content: bytes):
         return int.from_bytes(content[4:6], 'little', signed=False)
 
+    @property
+    def _bytes(self) -> bytes:
+        return self._view.tobytes()
+
+    def __bytes__(self):
+        return self._view.tobytes()
+
     def __str__(self):
         try:
-            return self._bytes.decode('utf-8').strip('\0')
+            return str(self._view, 'utf-8').strip('\0')
         except UnicodeDecodeError:
-            return self._bytes.decode('ascii').strip('\0')
+            return str(self._view, 'ascii').strip('\0')
 
     def __int__(self):
-        return int.from_bytes(self._bytes, 'little', signed=False)
+        return int.from_bytes(self._view, 'little', signed=False)
 
     def __float__(self, offset=0):
-        return struct.unpack('f', self._bytes)[0 + offset]
+        return self.float_structure.unpack_from(self._view, 4 * offset)[0]
 
     def __len__(self):
         return self.header_size + self.size
 
+# Decoded field names, shared by all records.
+_field_names = {}
+
 class Group:
     header_size = 24
 
     # See https://en.uesp.net/wiki/Skyrim_Mod:Mod_File_Format for the full list.
-    # TODO: Add the remaining.
     group_types = [
         'Top',
         'World Children',
         'Interior Cell Block',
         'Interior Cell Sub-Block',
+        'Exterior Cell Block',
+        'Exterior Cell Sub-Block',
+        'Cell Children',
+        'Topic Children',
+        'Cell Persistent Children',
+        'Cell Temporary Children',
     ]
 
     def __init__(self, pointer: int, header):
         cls = self.__class__
-        if type(header) != bytes or len(header) != 24:
+        if not isinstance(header, (bytes, memoryview)) or len(header) != 24:
             raise ValueError(f'To initialize a {cls.__name__} object, pass a {self.header_size}-byte value read from the position in the file.')
         self._pointer = pointer
         self._header = header
+        self.index = None  # Position in the group table of the reader that created this group.
         if self.type != 'GRUP':
             raise TypeError(f'Not a GRUP. Type is: {self.type}')
 
@@ -166,9 +420,9 @@ class Group:
     @property
     def type(self):
         try:
-            return self._header[0:4].decode('utf-8')
+            return str(self._header[0:4], 'utf-8')
         except UnicodeDecodeError:
-            return self._header[0:4].decode('latin-1').strip('\0')
+            return str(self._header[0:4], 'latin-1').strip('\0')
 
     @property
     def group_type(self):
@@ -178,11 +432,28 @@ class Group:
     def label(self):
         if self.group_type == 0:
             try:
-                return self._header[8:12].decode('utf-8')
+                return str(self._header[8:12], 'utf-8')
             except UnicodeDecodeError:
-                return self._header[8:12].decode('latin-1').strip('\0')
+                return str(self._header[8:12], 'latin-1').strip('\0')
         elif self.group_type in [1, 6, 7, 8, 9]:
             return int.from_bytes(self._header[8:12], 'little', signed=False) # Form Id.
+        elif self.group_type in [2, 3]:
+            return int.from_bytes(self._header[8:12], 'little', signed=True) # Block number.
+        elif self.group_type in [4, 5]:
+            return struct.unpack('<hh', self._header[8:12])[::-1] # Grid coordinates: (x, y).
+
+    @property
+    def group_type_name(self):
+        return self.group_types[self.group_type]
+
+    def __eq__(self, other):
+        return isinstance(other, Group) and self._pointer == other._pointer and bytes(self._header) == bytes(other._header)
+
+    def __hash__(self):
+        return hash(self._pointer)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.group_type_name}: {self.label!r})'
 
     @property
     def version(self):
@@ -196,39 +467,94 @@ class Group:
 
 
 class Record:
+    __slots__ = ('_pointer', '_header', '_type', '_size', '_flags', '_form_id_value', '_timestamp',
+                 '_version_control', '_version', '_form_id', '_content', '_field_names', '_field_pointers',
+                 '_field_sizes', '_field_index', 'subrecords')
     header_size = 24
+    # Type, size, flags, form ID, timestamp, version control info, version and unknown.
+    header_structure = struct.Struct('<4sIIIHHHH')
+    compressed_flag = 1 << 18
+    _types = {}  # Interned record types, keyed by the 4 bytes in the header.
+    # Layouts of the fields, keyed by field name. Set by the subclasses in record_types.
+    schema = {}
 
     # TODO: Add functions for each data type: _get_int, _get_uint, _get_float
 
-    def __init__(self, pointer: int, header: bytes):
+    def __init__(self, pointer: int, header: Union[bytes, memoryview]):
         cls = self.__class__
-        if type(header) != bytes or len(header) != 24:
+        if not isinstance(header, (bytes, memoryview)) or len(header) != 24:
             raise ValueError(f'To initialize a {cls.__name__} object, pass a {self.header_size}-byte value read from the position in the file.')
         self._pointer = pointer
         self._header = header
+        (type_bytes, self._size, self._flags, self._form_id_value, self._timestamp,
+         self._version_control, self._version, _) = self.header_structure.unpack_from(header)
+        record_type = self._types.get(type_bytes)
+        if record_type is None:
+            record_type = self._types[type_bytes] = self.decode_type(type_bytes)
+        self._type = record_type
+
+    @staticmethod
+    def decode_type(type_bytes: bytes) -> str:
+        try:
+            return sys.intern(type_bytes.decode('utf-8'))
+        except UnicodeDecodeError:
+            return sys.intern(type_bytes.decode('latin-1').strip('\0'))
 
     def __len__(self):
         return self.header_size + self.size
 
     def __repr__(self):
-        return f'Record(pointer={self._pointer}, header={self._header}'
+        return f'Record(pointer={self._pointer}, header={bytes(self._header)}'
 
     def __str__(self):
         return f'{self.type} record at position {self._pointer}, with size {self.size}, Form ID: {self.form_id}'
 
-    def __setattr__(self, name, value):
-        if name == 'content':
-            self.set_content(value)
-        else:
-            self.__dict__[name] = value
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self._pointer == other._pointer and self._header == other._header
 
-    def __getitem__(self, key: Union[str, slice]) -> bytes:
+    def __hash__(self):
+        return hash(self._pointer)
+
+    def __getitem__(self, key: Union[str, slice]):
         if isinstance(key, slice):
             return self.content[key]
         if isinstance(key, str):
-            for field in self:
-                if field.name == key:
-                    yield field._bytes
+            return iter(self.get_all(key))
+        raise KeyError(key)
+
+    def __contains__(self, field_name: str) -> bool:
+        if not hasattr(self, '_field_pointers'):
+            self._parse_contents()
+        return field_name in self._field_index
+
+    def get_first(self, field_name: str) -> bytes:
+        """Return the data of the first field with the name, or None if the record does not have one."""
+        if not hasattr(self, '_field_pointers'):
+            self._parse_contents()
+        indices = self._field_index.get(field_name)
+        if indices is None:
+            return None
+        return self._get_field_bytes(indices[0])
+
+    def get_all(self, field_name: str) -> List[bytes]:
+        """Return the data of all fields with the name, in the order they appear in the record."""
+        if not hasattr(self, '_field_pointers'):
+            self._parse_contents()
+        return [self._get_field_bytes(i) for i in self._field_index.get(field_name, ())]
+
+    def decode(self, field_name: str) -> tuple:
+        """Decode the first field with the name into a named tuple, using the schema of the record class.
+
+        Return None if the record does not have the field."""
+        data = self.get_first(field_name)
+        if data is not None:
+            return self.schema[field_name].decode(data)
+
+    def _get_field_bytes(self, i: int) -> bytes:
+        _pos = self._field_pointers[i]
+        return self.content[_pos + Field.header_size:_pos + self._field_sizes[i]]
 
     def _parse_subrecords_in_group(self, group):
         starting_position = group.pointer + group.header_size
@@ -252,49 +578,66 @@ class Record:
             raise RuntimeError(f"Record Group of size {group.size} starting at {starting_position}, ending at {starting_position + group.size}, ended unexpectedly at position: {_pos}")
 
     def _parse_contents(self, starting_position=0, ending_position=None):
-        self._field_pointers = []
-        self._field_sizes = []
+        """Find the name, position and size of each field, without copying the content.
+
+        The field tables are kept only once the whole content has been parsed, so
+        a record whose content is not loaded yet is parsed again later."""
+        content = self.content
+        field_names, field_pointers, field_sizes, field_index = [], [], [], {}
         self.subrecords = {}
-        if ending_position is None:
-            ending_position = self.size
-        _pos = starting_position
-        self.fields = []
-        while _pos < ending_position:
-            field = Field(self.content[_pos:])
-            if field.name == 'GRUP':
-                group_header = self.content[_pos:_pos + Group.header_size]
+        decode_name = Field.decode_name
+        for name, _pos, size in Field.iter_headers(content, starting_position, ending_position):
+            if name == b'GRUP':
+                group_header = content[_pos:_pos + Group.header_size]
                 group = Group(_pos, group_header)
                 self._parse_subrecords_in_group(group)
-                _pos += group.size
             else:
-                self._field_pointers += [_pos]
-                self._field_sizes += [Field.header_size + Field.get_size_from_content(self.content[_pos:_pos + 6])]
-                self.fields += [field]
-                _pos += field.header_size + field.size
+                name = decode_name(name)
+                field_index.setdefault(name, []).append(len(field_names))
+                field_names += [name]
+                field_pointers += [_pos]
+                field_sizes += [Field.header_size + size]
+        self._field_names = field_names
+        self._field_sizes = field_sizes
+        self._field_index = field_index
+        # Set last: the other accessors check for it to know whether the content was parsed.
+        self._field_pointers = field_pointers
 
     def __iter__(self):
         if not hasattr(self, '_field_pointers'):
             self._parse_contents()
-        for i, _pos in enumerate(self._field_pointers):
-            field_size = self._field_sizes[i]
-            yield Field(self.content[_pos:_pos + field_size])
+        view = memoryview(self.content)
+        for name, _pos, field_size in zip(self._field_names, self._field_pointers, self._field_sizes):
+            yield Field._from_view(name, view[_pos + Field.header_size:_pos + field_size])
+
+    def iter_fields(self):
+        """Iterate over the fields while parsing the content, without keeping the field table.
+
+        Use this for very large records, such as navigation meshes, that are read only once."""
+        view = memoryview(self.content)
+        for name, _pos, size in Field.iter_headers(view):
+            if name != b'GRUP':
+                yield Field._from_view(Field.decode_name(name), view[_pos + Field.header_size:_pos + Field.header_size + size])
+
+    @property
+    def fields(self) -> list:
+        return list(self)
 
     @property
     def field_types(self):
-        return {field.name for field in self}
+        if not hasattr(self, '_field_pointers'):
+            self._parse_contents()
+        return set(self._field_names)
 
     @property
     def type(self):
-        try:
-            return self._header[0:4].decode('utf-8')
-        except UnicodeDecodeError:
-            return self._header[0:4].decode('latin-1').strip('\0')
+        return self._type
 
     @property
     def is_compressed(self):
-        if self.type == 'GRUP':
+        if self._type == 'GRUP':
             return False
-        return self._get_flag(18)
+        return bool(self._flags & self.compressed_flag)
 
     @property
     def is_esm(self):
@@ -305,8 +648,7 @@ class Record:
         return self._get_flag(9)
 
     def _get_flag(self, bit):
-        return self._get_bit(self._header[8:12], bit)
-        # return bool(int.from_bytes(self._header[8:12], 'little', signed=False) & 2 ** bit)
+        return bool(self._flags >> bit & 1)
 
     @staticmethod
     def _get_bit(longword: bytes, bit: int):
@@ -318,34 +660,46 @@ class Record:
 
     @property
     def size(self):
-        return int.from_bytes(self._header[4:8], 'little', signed=False)
+        return self._size
+
+    @property
+    def flags(self):
+        return self._flags
 
     @property
     def label(self):
-        if self.type == 'GRUP':
-            return int.from_bytes(self._header[8:12], 'little', signed=False)
+        if self._type == 'GRUP':
+            return self._flags
 
     @property
     def version(self):
-        if self.type == 'GRUP':
-            return int.from_bytes(self.buffer[18:20], 'little', signed=False)
+        if self._type == 'GRUP':
+            return self._version_control
         else:
-            return int.from_bytes(self.buffer[20:22], 'little', signed=False)
+            return self._version
 
     @property
     def form_id(self):
-        if self.type != 'GRUP':
-            return FormId(self._header[12:16])
+        if self._type != 'GRUP':
+            try:
+                return self._form_id
+            except AttributeError:
+                self._form_id = FormId._from_int(self._form_id_value)
+                return self._form_id
 
     @property
     def timestamp(self):
         # TODO: Add formatting based on the Wiki page. Different in Skyrim SE and LE.
-        return int.from_bytes(self._header[16:18], 'little', signed=False)
+        return self._timestamp
 
     def set_content(self, content: bytes):
         if not self.is_compressed:
             assert len(content) == self.size
         self._content = content
+        try:
+            del self._field_pointers  # Parse the new content on the next access.
+        except AttributeError:
+            pass
 
     def get_content(self):
         try:
@@ -357,19 +711,26 @@ class Record:
     def content(self):
         return self.get_content()
 
+    @content.setter
+    def content(self, content: bytes):
+        self.set_content(content)
+
     @property
     def editor_id(self):
-        for editor_id in self['EDID']:
+        editor_id = self.get_first('EDID')
+        if editor_id is not None:
             return editor_id.decode('utf-8').strip('\0')
 
     @property
     def full_name(self):
-        if 'FULL' in self:
-            for full_name in self['FULL']:
-                return full_name.decode('utf-8').strip('\0')
+        full_name = self.get_first('FULL')
+        if full_name is not None:
+            return full_name.decode('utf-8').strip('\0')
 
 
 class Reader:
+    _buffer = None
+
     def __init__(self, file_path):
         if not os.path.exists(file_path):
             raise FileNotFoundError
@@ -377,19 +738,499 @@ class Reader:
         self.file_name = os.path.basename(file_path)
 
     def _read_bytes(self, pos: int, length: int=1) -> bytes:
+        if self._buffer is not None:
+            return self._buffer[pos:pos + length]
         self._file.seek(pos)
         return self._file.read(length)
 
+    def _open_buffer(self):
+        """Memory-map the open file, so that reads become slices instead of syscalls."""
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._buffer)
+
+    def _close_buffer(self):
+        if self._buffer is None:
+            return
+        self._view.release()
+        try:
+            self._buffer.close()
+        except BufferError:
+            # Records still hold slices of the map. It is unmapped when the last one is released.
+            pass
+        self._buffer = None
+
     def _read_string(self, _pos):
         _bytes = self._read_bytes(_pos)
         while _bytes[-1] != 0:
             _pos += 1
             _bytes += self._read_bytes(_pos)
 
+        return self._decode_string(_bytes[:-1])
+
+    @staticmethod
+    def _decode_string(_bytes) -> str:
+        """Decode a name from UTF-8, or from latin-1 if it is not valid UTF-8."""
         try:
-            return _bytes[:-1].decode('utf-8')
+            return str(_bytes, 'utf-8')
         except UnicodeDecodeError:
-            return _bytes[:-1].decode('latin-1')
+            return str(_bytes, 'latin-1')
+
+
+class RecordTable:
+    """A compact index of the record and group headers in a file.
+
+    Each header field is stored in its own array, with one row per record, so
+    the index of a large master file takes a few dozen bytes per record.
+    Record objects are created only when a row is accessed, see
+    ElderScrollsFileReader.record_at. The columns can be filtered in bulk,
+    or wrapped without copying, for example with numpy.frombuffer.
+
+    Groups are kept in a second set of columns, with the index of the parent
+    group, and the range of rows that were added while the group was scanned.
+    A group can be deferred: it is added to the table, but its contents are
+    scanned only when they are needed. Deferred groups are listed in
+    pending_groups until they are scanned.
+    """
+    # Type, size, flags (or group label), form ID (or group type), and the
+    # remaining 8 bytes: timestamp, version control info, version and unknown.
+    header_structure = struct.Struct('<IIIIQ')
+    # Bumped whenever the layout written by to_bytes changes.
+    format_version = 3
+    # Group types of World Children, Cell Children and Topic Children.
+    children_group_types = (1, 6, 7)
+    # Values of the group_states column.
+    scanned, pending, scanned_later = 0, 1, 2
+
+    def __init__(self):
+        self.offsets = array('Q')
+        self.sizes = array('I')
+        self.type_codes = array('I')
+        self.flags = array('I')
+        self.form_ids = array('I')
+        self.stamps = array('Q')
+        self.parent_groups = array('i')
+        self.group_offsets = array('Q')
+        self.group_sizes = array('I')
+        self.group_labels = array('I')
+        self.group_types = array('i')
+        self.group_stamps = array('Q')
+        self.group_parents = array('i')
+        self.group_row_starts = array('I')
+        self.group_row_ends = array('I')
+        self.group_states = array('b')
+        self.rows_by_type = {}
+        self.rows_by_group = {}
+        self.child_groups = {}  # Keyed by the parent group, -1 for the top-level groups.
+        self.children_groups = {}  # Keyed by the form ID of the record that the children belong to.
+        self.pending_groups = {}  # Used as an ordered set.
+        self._sorted_form_ids = None
+        self._rows_by_sorted_form_id = None
+        self._unsorted_form_ids = {}
+        # Editor IDs in lower case, sorted, and the rows of their records. None until set_editor_ids is called.
+        self._editor_ids = None
+        self._rows_by_editor_id = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @staticmethod
+    def encode_type(record_type: str) -> int:
+        return int.from_bytes(record_type.encode('latin-1'), 'little', signed=False)
+
+    @staticmethod
+    def decode_type(type_code: int) -> str:
+        type_bytes = type_code.to_bytes(4, 'little')
+        try:
+            return type_bytes.decode('utf-8')
+        except UnicodeDecodeError:
+            return type_bytes.decode('latin-1').strip('\0')
+
+    def add_record(self, offset: int, type_code: int, size: int, flags: int, form_id: int, stamp: int,
+                   parent_group: int=-1, top_group_label: int=0) -> int:
+        """Append a record header, and return its row number."""
+        row = len(self.offsets)
+        self.offsets.append(offset)
+        self.sizes.append(size)
+        self.type_codes.append(type_code)
+        self.flags.append(flags)
+        self.form_ids.append(form_id)
+        self.stamps.append(stamp)
+        self.parent_groups.append(parent_group)
+        rows = self.rows_by_type.get(type_code)
+        if rows is None:
+            rows = self.rows_by_type[type_code] = array('I')
+        rows.append(row)
+        if top_group_label:
+            rows = self.rows_by_group.get(top_group_label)
+            if rows is None:
+                rows = self.rows_by_group[top_group_label] = array('I')
+            rows.append(row)
+        if self._sorted_form_ids is not None:
+            # Keep the sorted form IDs, and look up rows added after sorting them in a dictionary.
+            self._unsorted_form_ids[form_id] = row
+            if len(self._unsorted_form_ids) > max(1 << 16, len(self._sorted_form_ids) >> 2):
+                self._sorted_form_ids = None
+                self._unsorted_form_ids = {}
+        return row
+
+    def add_group(self, offset: int, size: int, label: int, group_type: int, stamp: int,
+                  parent_group: int=-1, deferred: bool=False) -> int:
+        """Append a group header, and return its group number.
+
+        The rows of the records in the group are expected to be added next, unless the group is deferred."""
+        group = len(self.group_offsets)
+        self.group_offsets.append(offset)
+        self.group_sizes.append(size)
+        self.group_labels.append(label)
+        self.group_types.append(group_type)
+        self.group_stamps.append(stamp)
+        self.group_parents.append(parent_group)
+        self.group_row_starts.append(len(self))
+        self.group_row_ends.append(len(self))
+        self.group_states.append(self.pending if deferred else self.scanned)
+        self._index_group(group)
+        if deferred:
+            self.pending_groups[group] = None
+        return group
+
+    def _index_group(self, group: int):
+        self.child_groups.setdefault(self.group_parents[group], []).append(group)
+        if self.group_types[group] in self.children_group_types:
+            self.children_groups[self.group_labels[group]] = group
+
+    def set_group_rows(self, group: int, row_start: int, row_end: int):
+        self.group_row_starts[group] = row_start
+        self.group_row_ends[group] = row_end
+        if self.group_states[group] == self.pending:
+            self.group_states[group] = self.scanned_later
+            del self.pending_groups[group]
+
+    def group_rows(self, group: int, recursive: bool=False) -> list:
+        """Return the rows in a group, in file order. If recursive, include the rows in nested groups."""
+        rows = range(self.group_row_starts[group], self.group_row_ends[group])
+        if not recursive:
+            parent_groups = self.parent_groups
+            return [row for row in rows if parent_groups[row] == group]
+        rows = list(rows)
+        nested_groups = list(self.child_groups.get(group, ()))
+        while nested_groups:
+            nested_group = nested_groups.pop()
+            if self.group_states[nested_group] == self.scanned_later:
+                rows += range(self.group_row_starts[nested_group], self.group_row_ends[nested_group])
+            nested_groups += self.child_groups.get(nested_group, ())
+        rows.sort(key=self.offsets.__getitem__)
+        return rows
+
+    def top_group_label(self, group: int) -> int:
+        """Return the label of the top-level group that contains a group."""
+        while self.group_parents[group] != -1:
+            group = self.group_parents[group]
+        return self.group_labels[group] if self.group_types[group] == 0 else 0
+
+    def header_at(self, row: int) -> bytes:
+        """Rebuild the 24-byte header of the record in a row."""
+        return self.header_structure.pack(self.type_codes[row], self.sizes[row], self.flags[row],
+                                          self.form_ids[row], self.stamps[row])
+
+    def group_header_at(self, group: int) -> bytes:
+        """Rebuild the 24-byte header of a group."""
+        return self.header_structure.pack(self.encode_type('GRUP'), self.group_sizes[group], self.group_labels[group],
+                                          self.group_types[group], self.group_stamps[group])
+
+    def find(self, form_id: int) -> int:
+        """Return the row of the record with a form ID. If a form ID repeats, the last row is returned."""
+        if self._sorted_form_ids is None:
+            self._sort_form_ids()
+        row = self._unsorted_form_ids.get(form_id)
+        if row is not None:
+            return row
+        i = bisect.bisect_right(self._sorted_form_ids, form_id) - 1
+        if i < 0 or self._sorted_form_ids[i] != form_id:
+            raise KeyError(form_id)
+        return self._rows_by_sorted_form_id[i]
+
+    def _sort_form_ids(self):
+        form_ids = self.form_ids
+        rows = sorted(range(len(form_ids)), key=form_ids.__getitem__)
+        self._rows_by_sorted_form_id = array('I', rows)
+        self._sorted_form_ids = array('I', map(form_ids.__getitem__, rows))
+        self._unsorted_form_ids = {}
+
+    @property
+    def has_editor_ids(self) -> bool:
+        return self._editor_ids is not None
+
+    def set_editor_ids(self, editor_ids: dict):
+        """Index the rows by editor ID. Editor IDs are matched without regard to case, as in the game."""
+        rows_by_editor_id = {editor_id.lower(): row for editor_id, row in editor_ids.items()}
+        self._editor_ids = sorted(rows_by_editor_id)
+        self._rows_by_editor_id = array('I', map(rows_by_editor_id.__getitem__, self._editor_ids))
+
+    def find_editor_id(self, editor_id: str) -> int:
+        """Return the row of the record with an editor ID."""
+        key = editor_id.lower()
+        i = bisect.bisect_left(self._editor_ids, key)
+        if i == len(self._editor_ids) or self._editor_ids[i] != key:
+            raise KeyError(editor_id)
+        return self._rows_by_editor_id[i]
+
+    def editor_id_rows(self, prefix: str='', substring: str=None) -> list:
+        """Return the rows of the records with editor IDs that start with prefix, and contain substring if given.
+
+        The rows are sorted by editor ID."""
+        prefix = prefix.lower()
+        editor_ids, rows = self._editor_ids, self._rows_by_editor_id
+        start = bisect.bisect_left(editor_ids, prefix)
+        # Every string that starts with the prefix sorts before the prefix followed by the largest character.
+        end = bisect.bisect_left(editor_ids, prefix + chr(sys.maxunicode), start) if prefix else len(editor_ids)
+        if substring is None:
+            return rows[start:end].tolist()
+        substring = substring.lower()
+        return [rows[i] for i in range(start, end) if substring in editor_ids[i]]
+
+    @property
+    def _columns(self):
+        return [self.offsets, self.sizes, self.type_codes, self.flags, self.form_ids, self.stamps,
+                self.parent_groups, self._sorted_form_ids, self._rows_by_sorted_form_id]
+
+    @property
+    def _group_columns(self):
+        return [self.group_offsets, self.group_sizes, self.group_labels, self.group_types, self.group_stamps,
+                self.group_parents, self.group_row_starts, self.group_row_ends, self.group_states]
+
+    def to_bytes(self) -> bytes:
+        """Serialize the table. The columns are written as raw arrays, in the byte order of the machine."""
+        if self.pending_groups:
+            raise ValueError('Scan the pending groups before serializing a record table.')
+        if self._sorted_form_ids is None or self._unsorted_form_ids:
+            self._sort_form_ids()
+        parts = [struct.pack('<II', len(self), len(self.group_offsets))]
+        parts += [column.tobytes() for column in self._columns + self._group_columns]
+        for index in (self.rows_by_type, self.rows_by_group):
+            parts.append(struct.pack('<I', len(index)))
+            for key, rows in index.items():
+                parts += [struct.pack('<II', key, len(rows)), rows.tobytes()]
+        if self._editor_ids is None:
+            parts.append(struct.pack('<iI', -1, 0))
+        else:
+            editor_ids = '\0'.join(self._editor_ids).encode('utf-8')
+            parts += [struct.pack('<iI', len(self._editor_ids), len(editor_ids)),
+                      self._rows_by_editor_id.tobytes(), editor_ids]
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> 'RecordTable':
+        """Rebuild a table serialized with to_bytes on a machine with the same byte order."""
+        table = cls()
+        table._sorted_form_ids = array('I')
+        table._rows_by_sorted_form_id = array('I')
+        view = memoryview(data)
+        row_count, group_count = struct.unpack_from('<II', view, 0)
+        _pos = 8
+
+        def read_column(column, count):
+            nonlocal _pos
+            length = column.itemsize * count
+            if len(view) < _pos + length:
+                raise ValueError('Serialized record table is truncated.')
+            column.frombytes(view[_pos:_pos + length])
+            _pos += length
+
+        for column in table._columns:
+            read_column(column, row_count)
+        for column in table._group_columns:
+            read_column(column, group_count)
+        for index in (table.rows_by_type, table.rows_by_group):
+            key_count, = struct.unpack_from('<I', view, _pos)
+            _pos += 4
+            for _ in range(key_count):
+                key, count = struct.unpack_from('<II', view, _pos)
+                _pos += 8
+                index[key] = array('I')
+                read_column(index[key], count)
+        editor_id_count, editor_ids_length = struct.unpack_from('<iI', view, _pos)
+        _pos += 8
+        if editor_id_count >= 0:
+            table._rows_by_editor_id = array('I')
+            read_column(table._rows_by_editor_id, editor_id_count)
+            editor_ids = str(view[_pos:_pos + editor_ids_length], 'utf-8')
+            table._editor_ids = editor_ids.split('\0') if editor_id_count else []
+            _pos += editor_ids_length
+        if _pos != len(view):
+            raise ValueError('Serialized record table has unexpected trailing bytes.')
+        for group in range(group_count):
+            table._index_group(group)
+        return table
+
+    def rows(self, record_type: str=None, flag: int=None, min_size: int=0, max_size: int=None):
+        """Iterate over the rows that match the type, have the flag bit set and fall into the size range.
+
+        Rows of groups that have not been scanned yet are not included."""
+        if record_type is None:
+            candidates = range(len(self))
+        else:
+            candidates = self.rows_by_type.get(self.encode_type(record_type), ())
+        flags, sizes = self.flags, self.sizes
+        mask = 0 if flag is None else 1 << flag
+        for row in candidates:
+            if flags[row] & mask != mask:
+                continue
+            size = sizes[row]
+            if size < min_size or (max_size is not None and size > max_size):
+                continue
+            yield row
+
+
+class _RecordsByFormId(Mapping):
+    """Read-only mapping of form IDs to records, backed by the record table of a reader."""
+    def __init__(self, reader):
+        self._reader = reader
+
+    def __getitem__(self, form_id: int) -> Record:
+        return self._reader.record_at(self._reader._find_row(form_id))
+
+    def __contains__(self, form_id):
+        try:
+            self._reader._find_row(form_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        self._reader._scan_pending_groups()
+        return iter(self._reader.record_table.form_ids)
+
+    def __len__(self):
+        self._reader._scan_pending_groups()
+        return len(self._reader.record_table)
+
+    def values(self):
+        self._reader._scan_pending_groups()
+        return map(self._reader.record_at, range(len(self._reader.record_table)))
+
+
+class Query:
+    """A filter over the records of a file. Create one with ElderScrollsFileReader.query.
+
+    Usage example:
+        essential_npcs = (skyrim_main_file.query('NPC_')
+                          .form_id_range(0x10000, 0x1ffff)
+                          .where_field('ACBS', lambda acbs: acbs.flags & 2))
+        for npc in essential_npcs:
+            print(npc.editor_id)
+
+    The conditions on the record type, the flags and the form IDs, and on the
+    editor IDs once the editor ID index is built, are checked against the
+    header index, so they cost no reads. The contents of the
+    records that pass them are then loaded in batches, and checked against the
+    conditions on the fields. Each method adds a condition and returns the
+    query, so the calls can be chained. All conditions need to hold.
+    """
+    def __init__(self, reader, record_type: str=None):
+        self._reader = reader
+        self._record_type = record_type
+        self._flags_set = 0
+        self._flags_unset = 0
+        self._form_id_ranges = []
+        self._row_sets = []
+        self._predicates = []
+
+    def __iter__(self):
+        return self.run()
+
+    def with_flag(self, bit: int) -> 'Query':
+        """Keep the records with a flag bit set, for example: with_flag(18) for compressed records."""
+        self._flags_set |= 1 << bit
+        return self
+
+    def without_flag(self, bit: int) -> 'Query':
+        self._flags_unset |= 1 << bit
+        return self
+
+    def form_id_range(self, first: Union[str, int, FormId], last: Union[str, int, FormId]) -> 'Query':
+        """Keep the records with form IDs from first to last, including both."""
+        self._form_id_ranges.append((ElderScrollsFileReader._get_form_id(first),
+                                     ElderScrollsFileReader._get_form_id(last)))
+        return self
+
+    def editor_id_startswith(self, prefix: str) -> 'Query':
+        """Keep the records with editor IDs that start with prefix, without regard to case.
+
+        If the editor ID index of the reader is built, this is checked against the index."""
+        table = self._reader.record_table
+        if table.has_editor_ids:
+            self._row_sets.append(set(table.editor_id_rows(prefix)))
+            return self
+        prefix = prefix.lower()
+        return self.where(lambda record: (record.editor_id or '').lower().startswith(prefix))
+
+    def where_field(self, field_name: str, predicate) -> 'Query':
+        """Keep the records that have the field, and for which predicate returns True.
+
+        The predicate gets the first field with the name, decoded into a named tuple
+        if record_types.schemas has a layout for it, or as bytes otherwise."""
+        from .record_types import schemas
+        layout = schemas.get(self._record_type, {}).get(field_name)
+
+        def field_predicate(record):
+            data = record.get_first(field_name)
+            if data is None:
+                return False
+            return predicate(data if layout is None else layout.decode(data))
+        return self.where(field_predicate)
+
+    def where(self, predicate) -> 'Query':
+        """Keep the records for which predicate returns True. The predicate gets a record with its content."""
+        self._predicates.append(predicate)
+        return self
+
+    def rows(self):
+        """Iterate over the rows that pass the conditions on the headers."""
+        reader, table = self._reader, self._reader.record_table
+        if self._record_type is None:
+            reader._scan_pending_groups()
+            rows = range(1, len(table))  # Leave out the TES4 record.
+        else:
+            reader._scan_groups_for_type(self._record_type)
+            rows = table.rows_by_type.get(RecordTable.encode_type(self._record_type), ())
+        flags, form_ids = table.flags, table.form_ids
+        mask, expected = self._flags_set | self._flags_unset, self._flags_set
+        ranges, row_sets = self._form_id_ranges, self._row_sets
+        for row in rows:
+            if flags[row] & mask != expected:
+                continue
+            if ranges and not all(first <= form_ids[row] <= last for first, last in ranges):
+                continue
+            if row_sets and not all(row in row_set for row_set in row_sets):
+                continue
+            yield row
+
+    def run(self, workers: int=None, batch_size: int=4096):
+        """Iterate over the matching records, in the order of the index.
+
+        The contents are loaded batch_size records at a time, and decompressed
+        with workers threads, see ElderScrollsFileReader.load_record_contents.
+        Only the contents of the records that match are kept."""
+        reader = self._reader
+        if not self._predicates:
+            yield from map(reader.record_at, self.rows())
+            return
+        rows = self.rows()
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                return
+            loaded_before = {row for row in batch if row in reader._contents}
+            reader._load_rows([row for row in batch if row not in loaded_before], workers)
+            for row in batch:
+                record = reader.record_at(row)
+                if all(predicate(record) for predicate in self._predicates):
+                    yield record
+                elif row not in loaded_before:
+                    del reader._contents[row]
+
+    def count(self, workers: int=None) -> int:
+        return sum(1 for _ in self.run(workers))
 
 
 class ElderScrollsFileReader(Reader):
@@ -408,29 +1249,95 @@ class ElderScrollsFileReader(Reader):
             print(npc.form_id)  # Print form IDs of all NPCs.
 
         print(skyrim_main_file[0x1033ee])  # Return the record with the form ID 0x1033ee
-    """
 
-    def __init__(self, file_path):
+        for reference in skyrim_main_file.children_of(0x1033ee):
+            print(reference)  # Print the references in a cell.
+
+    Pass use_mmap=True to memory-map the file. The record headers are then
+    scanned in one pass over the mapped buffer, and each record holds a
+    memoryview of its header instead of a copy.
+
+    The headers are kept in a RecordTable, available as record_table. Record
+    objects are created from it on access. The groups form a tree, see
+    top_groups, subgroups, group_records and children_of.
+
+    Pass lazy_children=True to skip the World Children, Cell Children and
+    Topic Children groups during the scan. Each of them is scanned when it is
+    first needed, for example when children_of is called for its cell.
+
+    Pass lazy_top_groups=True to read only the headers of the top-level groups
+    when the file is opened. A top-level group is scanned when its records are
+    first accessed, for example with reader['BOOK']. A form ID lookup scans
+    the groups in file order until the form ID is found. Records of types
+    that are nested in other groups, such as REFR, and the CELL, WRLD and DIAL
+    records, need all groups to be scanned. Rows are then numbered in the
+    order in which their groups were scanned.
+
+    Pass a folder as cache_folder to save the header index there after the first
+    scan, and to reuse it when the same file is opened again. The cached index is
+    used if the file has the same size, the same modification time and the same
+    checksum of its first and last 64 KiB. If the cache cannot be written, the
+    file is opened without it. With lazy_children or lazy_top_groups, the index
+    is saved once every group has been scanned.
+
+    Pass editor_id_index=True to also index the editor IDs when the file is
+    opened, see by_editor_id. The editor ID index is saved with the cache.
+
+    To open many files at once, see open_many. It scans the files in separate
+    processes, and passes each index in as record_table.
+    """
+    # Magic, format version, byte order, file size, modification time, checksum and number of masters.
+    index_cache_header = struct.Struct('<4sHcQqII')
+    index_cache_magic = b'TESI'
+    fingerprint_length = 1 << 16
+    # Batch size for the decompression of records, see _decompress_in_batches.
+    decompression_batch_size = 1 << 20
+    # Top-level groups that contain records of other types, in nested groups.
+    container_group_labels = ('CELL', 'WRLD', 'DIAL')
+
+    def __init__(self, file_path, use_mmap: bool=False, cache_folder: str=None, lazy_children: bool=False,
+                 lazy_top_groups: bool=False, record_table: RecordTable=None, editor_id_index: bool=False):
         super().__init__(file_path)
         self._file = open(self.file_path, 'rb')
+        if use_mmap:
+            self._open_buffer()
         try:
             assert self._read_bytes(0, 4) == b'TES4'
         except AssertionError:
             raise RuntimeError('Incorrect file header - is this a TES4 file?')
-        self._read_all_record_headers()
-        self.load_record_content(self['TES4'][0])
-        self.tes4record = self['TES4'][0]
-        self.masters = []
-        if self.tes4record['MAST'] is not None:
+        self.record_table = RecordTable() if record_table is None else record_table
+        self.records = _RecordsByFormId(self)
+        self._contents = {}
+        self._lazy_children = lazy_children
+        self._lazy_top_groups = lazy_top_groups
+        self.masters = None
+        self._cache_folder = None  # Set once the file is open, so that scans while opening do not save the cache.
+        if record_table is not None:
+            cache_folder = None  # The table was scanned elsewhere, or already loaded from the cache.
+        elif cache_folder is None or not self._load_index_cache(self._get_index_cache_path(cache_folder)):
+            self._read_all_record_headers()
+        # The TES4 record is always the first record in the file.
+        self._contents[0] = self._read_row_content(0)
+        self.tes4record = self.record_at(0)
+        cache_is_stale = self.masters is None
+        if self.masters is None:
+            self.masters = []
             for master in self.tes4record['MAST']:
                 self.masters += [master.decode('utf-8').strip('\0')]
+        if editor_id_index and not self.record_table.has_editor_ids:
+            self._build_editor_id_index()
+            cache_is_stale = True
+        self._cache_folder = cache_folder
+        if cache_is_stale:
+            self._update_index_cache()
         # TODO: Add CNAM and SNAM - Author & Description.
-        # TOOD: Add the ESL bit, record count, group count and version.
+        # TOOD: Add the record count, group count and version.
 
     def __enter__(self):
         return self
 
     def __exit__(self, exception_type, exception_val, trace):
+        self._close_buffer()
         self._file.close()
 
     def __getitem__(self, key):
@@ -439,17 +1346,10 @@ class ElderScrollsFileReader(Reader):
                 raise KeyError(f'{self.__class__.__name__} does not allow slicing '
                                 'with a step. Use only one colon in slice, for example: [0:4]')
             return self._read_bytes(key.start, key.stop - key.start)
-        elif isinstance(key, int):
-            return self.records[key]
-        elif isinstance(key, Record):
-            return self.records[int(key.form_id)]
-        elif isinstance(key, str):
-            if len(key) == 4:
-                return [record for record in self.records.values() if record.type == key]
-            elif key[:2] == '0x':
-                return self.records[int(key, 16)]
+        elif isinstance(key, str) and len(key) == 4:
+            return list(self.iter_type(key))
         else:
-            raise KeyError
+            return self.record_at(self._find_row(key))
 
     def __iter__(self):
         return iter(self.records.values())
@@ -458,61 +1358,472 @@ class ElderScrollsFileReader(Reader):
         return len(self.records)
 
     def __contains__(self, val):
-        return val in self.records or val in self.record_types
+        if isinstance(val, str) and len(val) == 4:
+            self._scan_groups_for_type(val)
+            return RecordTable.encode_type(val) in self.record_table.rows_by_type
+        return val in self.records
 
     @property
     def pos(self):
         return self._file.tell()
 
+    @property
+    def is_light(self) -> bool:
+        """True for light plugins: files with the ESL flag, or with the .esl extension."""
+        return self.tes4record.is_esl or self.file_name.lower().endswith('.esl')
+
     @property
     def record_types(self) -> set:
-        return {record.type for record in self.records.values()}
+        self._scan_pending_groups()
+        return {RecordTable.decode_type(type_code) for type_code in self.record_table.rows_by_type}
 
-    def _reset(self):
-        self._file.seek(0)
+    @property
+    def group_labels(self) -> set:
+        """Labels of the top-level groups in the file, for example: {'BOOK', 'CELL', 'WRLD'}"""
+        return {group.label for group in self.top_groups}
 
-    def _read_record_header(self, pos):
-        return self._read_bytes(pos, 24)
+    @property
+    def top_groups(self) -> List[Group]:
+        return [self.group_at(group) for group in self.record_table.child_groups.get(-1, ())]
+
+    def iter_type(self, record_type: str):
+        """Iterate over the records of one type, without building a list."""
+        self._scan_groups_for_type(record_type)
+        rows = self.record_table.rows_by_type.get(RecordTable.encode_type(record_type), ())
+        return map(self.record_at, rows)
+
+    def iter_group(self, label: str):
+        """Iterate over all records under a top-level group, including nested groups.
+
+        For example, iter_group('CELL') also returns the REFR records in the interior cells."""
+        label_code = RecordTable.encode_type(label)
+        for group in self.record_table.child_groups.get(-1, ()):
+            if self.record_table.group_labels[group] == label_code:
+                self._scan_group(group, recursive=True)
+        rows = self.record_table.rows_by_group.get(label_code, ())
+        return map(self.record_at, rows)
+
+    def subgroups(self, group: Group) -> List[Group]:
+        """Return the groups directly under a group."""
+        self._scan_group(group.index)
+        return [self.group_at(subgroup) for subgroup in self.record_table.child_groups.get(group.index, ())]
+
+    def group_records(self, group: Group, recursive: bool=False) -> List[Record]:
+        """Return the records directly under a group, or also those in nested groups if recursive."""
+        self._scan_group(group.index, recursive)
+        return [self.record_at(row) for row in self.record_table.group_rows(group.index, recursive)]
+
+    def children_of(self, record: Union[str, int, Record], recursive: bool=True) -> List[Record]:
+        """Return the records in the children group of a world, cell or dialogue topic.
+
+        Usage example:
+            for reference in skyrim_main_file.children_of(cell_form_id):
+                print(reference.type, reference.form_id)
+
+        Only the children group is scanned, so for a cell in a large world only
+        the bytes of that cell are read. With recursive=False, the records
+        directly in the children group are returned; for worlds and cells they
+        are all in nested groups, see get_children_group and subgroups.
+        """
+        group = self.get_children_group(record)
+        if group is None:
+            return []
+        return self.group_records(group, recursive)
+
+    def get_children_group(self, record: Union[str, int, Record]) -> Group:
+        """Return the World Children, Cell Children or Topic Children group of a record, or None."""
+        form_id = self._get_form_id(record)
+        table = self.record_table
+        while form_id not in table.children_groups:
+            # Children groups are found only next to the worlds, cells and topics they belong to.
+            groups = self._pending_container_groups()
+            if not groups:
+                return None
+            for group in groups:
+                self._scan_group(group)
+                if form_id in table.children_groups:
+                    break
+        return self.group_at(table.children_groups[form_id])
+
+    def by_editor_id(self, editor_id: str) -> Record:
+        """Return the record with an editor ID, for example: by_editor_id('Ysolda').
+
+        Editor IDs are matched without regard to case. The first call builds the
+        editor ID index, unless it was built at open or loaded from the cache."""
+        if not self.record_table.has_editor_ids:
+            self.build_editor_id_index()
+        return self.record_at(self.record_table.find_editor_id(editor_id))
+
+    def search_editor_ids(self, prefix: str='', substring: str=None) -> List[Record]:
+        """Return the records with editor IDs that start with prefix, and contain substring if given.
+
+        The records are sorted by editor ID, and matched without regard to case."""
+        if not self.record_table.has_editor_ids:
+            self.build_editor_id_index()
+        return [self.record_at(row) for row in self.record_table.editor_id_rows(prefix, substring)]
+
+    def build_editor_id_index(self):
+        """Read the editor ID of every record, and index the records by it.
+
+        Only the first field of each record is needed, so compressed records are
+        decompressed only as far as their editor ID. The index is saved to the
+        cache, if the file was opened with cache_folder."""
+        self._build_editor_id_index()
+        self._update_index_cache()
+
+    def _build_editor_id_index(self, max_gap: int=4096, max_read_size: int=1 << 24):
+        self._scan_pending_groups()
+        table = self.record_table
+        editor_ids = {}
+        rows = sorted(range(1, len(table)), key=table.offsets.__getitem__)
+        for start, end, chunk_rows in self._coalesce_reads(rows, max_gap, max_read_size):
+            if self._buffer is not None:
+                chunk = self._view[start:end]
+            else:
+                chunk = memoryview(self._read_bytes(start, end - start))
+            for row in chunk_rows:
+                _pos = table.offsets[row] + Record.header_size - start
+                data = chunk[_pos:_pos + table.sizes[row]]
+                editor_id = self._read_editor_id(data, table.flags[row] & Record.compressed_flag)
+                if editor_id is not None:
+                    editor_ids[editor_id] = row
+        table.set_editor_ids(editor_ids)
 
-    def _read_record_headers_in_group(self, starting_position, size):
-        _pos = starting_position
-        ending_position = starting_position + size
-        while _pos < ending_position:
-            record_header = self._read_record_header(_pos)
-            record = Record(_pos, record_header)
-            if record.type == 'GRUP':
-                group = Group(_pos, record_header)
-                self._read_record_headers_in_group(_pos + group.header_size, group.size - group.header_size)
-                _pos += group.size
+    @staticmethod
+    def _read_editor_id(data: memoryview, compressed: bool) -> str:
+        """Return the editor ID in the content of a record, if the first field is an EDID field."""
+        if compressed:
+            decompressor = zlib.decompressobj()
+            header = decompressor.decompress(data[4:], Field.header_size)
+        else:
+            header = data[:Field.header_size]
+        if len(header) < Field.header_size or header[0:4] != b'EDID':
+            return None
+        _, size = Field.header_structure.unpack(header)
+        if compressed:
+            editor_id = decompressor.decompress(decompressor.unconsumed_tail, size)
+        else:
+            editor_id = data[Field.header_size:Field.header_size + size]
+        editor_id = bytes(editor_id).rstrip(b'\0')
+        try:
+            return editor_id.decode('utf-8')
+        except UnicodeDecodeError:
+            return editor_id.decode('latin-1')
+
+    def _update_index_cache(self):
+        if self._cache_folder is not None and not self.record_table.pending_groups:
+            self._save_index_cache(self._get_index_cache_path(self._cache_folder))
+
+    def query(self, record_type: str=None) -> Query:
+        """Start a query over the records of a type, or over all records. See Query."""
+        return Query(self, record_type)
+
+    def to_columns(self, record_type: str, fields: List[str]=(), arrow: bool=False):
+        """Return the records of a type as columns, with one entry per record. Needs NumPy.
+
+        Usage example:
+            columns = skyrim_main_file.to_columns('NPC_', fields=['EDID', 'ACBS'])
+            print(columns['ACBS']['level'].mean())
+
+        The form_id, flags and size columns come from the header index. For each
+        field name, the first field with that name in each record is read. Fields
+        with a layout in record_types.schemas become NumPy structured arrays, and
+        other fields become object arrays of bytes. Records without the field get
+        zeros, or an empty string, and False in the has_<name> column.
+
+        With arrow=True, return a pyarrow Table instead, with a column for each
+        value in a structured field, for example ACBS.level, and nulls for the
+        missing fields.
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('to_columns needs NumPy. Install it with: pip install tes-reader[numpy]')
+        from .record_types import schemas
+
+        self._scan_groups_for_type(record_type)
+        table = self.record_table
+        rows = numpy.frombuffer(table.rows_by_type.get(RecordTable.encode_type(record_type), array('I')),
+                                dtype=numpy.uint32)
+        columns = {}
+        for name, column in [('form_id', table.form_ids), ('flags', table.flags), ('size', table.sizes)]:
+            columns[name] = numpy.frombuffer(column, dtype=column.typecode)[rows]
+        if fields:
+            records = [self.record_at(row) for row in rows.tolist()]
+            self.load_record_contents(records)
+        for field_name in fields:
+            data = [record.get_first(field_name) for record in records]
+            present = numpy.array([field is not None for field in data], dtype=bool)
+            layout = schemas.get(record_type, {}).get(field_name)
+            if layout is None:
+                # An object array keeps the bytes whole. NumPy strips the trailing zero bytes of byte string arrays.
+                column = numpy.empty(len(data), dtype=object)
+                column[:] = [b'' if field is None else bytes(field) for field in data]
+                columns[field_name] = column
             else:
-                self.records[int(record.form_id)] = record
-                if not is_type(record.type):
-                    print(f'Weird record type: {record.type}')
-                    break
-                _pos += record.header_size + record.size
+                dtype = layout.numpy_dtype()
+                size = dtype.itemsize
+                empty = bytes(size)
+                buffer = b''.join(empty if field is None else bytes(field[:size]).ljust(size, b'\0') for field in data)
+                columns[field_name] = numpy.frombuffer(buffer, dtype=dtype)
+            columns[f'has_{field_name}'] = present
+        if arrow:
+            return self._to_arrow(columns, fields)
+        return columns
 
-        if _pos != ending_position:
-            raise RuntimeError(f"Record Group of size {group.size} starting at {starting_position}, ending at {starting_position + group.size}, ended unexpectedly at position: {_pos}")
+    @staticmethod
+    def _to_arrow(columns: dict, fields: List[str]):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('to_columns with arrow=True needs pyarrow. Install it with: pip install tes-reader[arrow]')
+        import numpy
+        arrow_columns = {}
+        for name, column in columns.items():
+            if name.startswith('has_') and name[4:] in fields:
+                continue
+            mask = ~columns[f'has_{name}'] if name in fields else None
+            if column.dtype.names is None:
+                arrow_columns[name] = pyarrow.array(column, mask=mask)
+            else:
+                for value_name in column.dtype.names:
+                    values = numpy.ascontiguousarray(column[value_name])
+                    arrow_columns[f'{name}.{value_name}'] = pyarrow.array(values, mask=mask)
+        return pyarrow.table(arrow_columns)
+
+    def record_at(self, row: int) -> Record:
+        """Return the record in a row of the record table."""
+        offset = self.record_table.offsets[row]
+        if self._buffer is not None:
+            header = self._view[offset:offset + Record.header_size]
+        else:
+            header = self.record_table.header_at(row)
+        record = Record(offset, header)
+        content = self._contents.get(row)
+        if content is not None:
+            record._content = content
+        return record
+
+    def group_at(self, index: int) -> Group:
+        """Return the group with an index in the group table."""
+        offset = self.record_table.group_offsets[index]
+        if self._buffer is not None:
+            header = self._view[offset:offset + Group.header_size]
+        else:
+            header = self.record_table.group_header_at(index)
+        group = Group(offset, header)
+        group.index = index
+        return group
 
+    @staticmethod
+    def _get_form_id(key: Union[str, int, FormId, Record]) -> int:
+        if isinstance(key, Record):
+            return key._form_id_value
+        elif isinstance(key, FormId):
+            return int(key)
+        elif isinstance(key, str) and key[:2] == '0x':
+            return int(key, 16)
+        elif isinstance(key, int):
+            return key
+        raise KeyError(key)
 
-    def _read_all_record_headers(self):
-        self.records = {}
-        record_position = 0
+    def _find_row(self, key: Union[str, int, Record]) -> int:
+        form_id = self._get_form_id(key)
+        table = self.record_table
         while True:
-            record_header = self._read_record_header(record_position)
             try:
-                record = Record(record_position, record_header)
-            except ValueError:
-                if len(record_header) != 0:
-                    raise RuntimeWarning(f"File ended unexpectedly at position: {record_position}")
-                break
-            if record.type == 'GRUP':
-                group = Group(record_position, record_header)
-                self._read_record_headers_in_group(record_position + group.header_size, group.size - group.header_size)
-                record_position += group.size
+                return table.find(form_id)
+            except KeyError:
+                if not table.pending_groups:
+                    raise
+            self._scan_group(next(iter(table.pending_groups)))
+
+    def _scan_group(self, group: int, recursive: bool=False):
+        """Scan a pending group, and if recursive, the pending groups nested in it."""
+        table = self.record_table
+        groups = [group]
+        scanned = False
+        while groups:
+            group = groups.pop()
+            if group in table.pending_groups:
+                row_start = len(table)
+                starting_position = table.group_offsets[group] + Group.header_size
+                ending_position = table.group_offsets[group] + table.group_sizes[group]
+                self._scan_headers(starting_position, ending_position, group, table.top_group_label(group))
+                table.set_group_rows(group, row_start, len(table))
+                scanned = True
+            if recursive:
+                groups += table.child_groups.get(group, ())
+        if scanned and not table.pending_groups:
+            self._update_index_cache()  # The whole file has now been scanned.
+
+    def _scan_pending_groups(self):
+        table = self.record_table
+        while table.pending_groups:
+            self._scan_group(next(iter(table.pending_groups)))
+
+    def _scan_groups_for_type(self, record_type: str):
+        """Scan the pending groups that may contain records of a type.
+
+        Records in a top-level group other than CELL, WRLD and DIAL all have the type
+        of the group label, so only that group is scanned for these types. For CELL,
+        WRLD and DIAL, see _pending_container_groups."""
+        table = self.record_table
+        if not table.pending_groups:
+            return
+        if record_type in self.container_group_labels:
+            groups = self._pending_container_groups(record_type)
+            while groups:
+                for group in groups:
+                    self._scan_group(group)
+                groups = self._pending_container_groups(record_type)
+            return
+        label_code = RecordTable.encode_type(record_type)
+        for group in table.child_groups.get(-1, ()):
+            if table.group_labels[group] == label_code and table.group_types[group] == 0:
+                self._scan_group(group, recursive=True)
+                return
+        self._scan_pending_groups()
+
+    def _pending_container_groups(self, record_type: str=None) -> List[int]:
+        """Return the pending groups that can contain records of a container type, or of any container type.
+
+        Worlds and dialogue topics are only in their top-level groups. Cells are in
+        the CELL group, and in the World Children groups inside the WRLD group.
+        Cell Children and Topic Children groups never contain these records."""
+        table = self.record_table
+        labels = self.container_group_labels if record_type is None else (record_type,)
+        top_group_labels = {RecordTable.encode_type(label) for label in labels}
+        if 'CELL' in labels:
+            top_group_labels.add(RecordTable.encode_type('WRLD'))
+        return [group for group in table.pending_groups
+                if (table.group_types[group] == 0 and table.group_labels[group] in top_group_labels)
+                or (table.group_types[group] == 1 and 'CELL' in labels)]
+
+    def _reset(self):
+        self._file.seek(0)
+
+    def _read_record_header(self, pos):
+        return self._read_bytes(pos, 24)
+
+    def _read_all_record_headers(self):
+        self._scan_headers(0, os.fstat(self._file.fileno()).st_size)
+
+    def _scan_headers(self, starting_position: int, ending_position: int, parent_group: int=-1, top_group_label: int=0):
+        """Read the record and group headers between two positions into the record table.
+
+        The contents of a group directly follow its header, so the scan steps into
+        a group by moving past its header. The open groups are kept on a stack, to
+        find the parent of each record and to check that each group ends where its
+        header says it does. Groups that are deferred are skipped over. In mmap
+        mode the headers are unpacked in place, otherwise each header is read
+        from the file.
+        """
+        table = self.record_table
+        if self._buffer is not None:
+            buffer = self._view
+            unpack_header = RecordTable.header_structure.unpack_from
+        else:
+            buffer = None
+            read_record_header = self._read_record_header
+            unpack = RecordTable.header_structure.unpack
+            unpack_header = lambda _, pos: unpack(read_record_header(pos))
+        add_record = table.add_record
+        group_type_code = RecordTable.encode_type('GRUP')
+        deferred_group_types = RecordTable.children_group_types if self._lazy_children else ()
+        defer_top_groups = self._lazy_top_groups
+        groups = []  # End position and group index of the open groups.
+        _pos = starting_position
+        while _pos < ending_position:
+            if ending_position - _pos < Record.header_size:
+                raise RuntimeWarning(f"File ended unexpectedly at position: {_pos}")
+            type_code, size, flags, form_id, stamp = unpack_header(buffer, _pos)
+            current_group = groups[-1][1] if groups else parent_group
+            if type_code == group_type_code:
+                if size < Group.header_size:
+                    raise RuntimeError(f"Record Group at position {_pos} has an invalid size: {size}")
+                if current_group == -1:
+                    top_group_label = flags if form_id == 0 else 0
+                deferred = form_id in deferred_group_types or (defer_top_groups and current_group == -1)
+                group = table.add_group(_pos, size, flags, form_id, stamp, current_group, deferred)
+                if deferred:
+                    _pos += size
+                else:
+                    groups.append((_pos + size, group))
+                    _pos += Group.header_size
             else:
-                self.records[int(record.form_id)] = record
-                record_position += record.header_size + record.size
+                if current_group == -1:
+                    add_record(_pos, type_code, size, flags, form_id, stamp)
+                else:
+                    add_record(_pos, type_code, size, flags, form_id, stamp, current_group, top_group_label)
+                _pos += Record.header_size + size
+            while groups and _pos >= groups[-1][0]:
+                if _pos != groups[-1][0]:
+                    raise RuntimeError(f"Record Group ending at {groups[-1][0]} ended unexpectedly at position: {_pos}")
+                table.group_row_ends[groups.pop()[1]] = len(table)
+        if groups or _pos != ending_position:
+            raise RuntimeWarning(f"File ended unexpectedly at position: {_pos}")
+
+    def _get_index_cache_path(self, cache_folder: str) -> str:
+        path_hash = hashlib.sha1(os.path.abspath(self.file_path).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(cache_folder, f'{self.file_name}.{path_hash}.idx')
+
+    def _get_fingerprint(self, file_size: int) -> int:
+        head = self._read_bytes(0, self.fingerprint_length)
+        tail = self._read_bytes(max(0, file_size - self.fingerprint_length), self.fingerprint_length)
+        return zlib.crc32(tail, zlib.crc32(head))
+
+    def _load_index_cache(self, cache_path: str) -> bool:
+        """Load the record table and the masters from the cache. Return False if the cache is missing or stale."""
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                data = cache_file.read()
+        except OSError:
+            return False
+        stat = os.stat(self.file_path)
+        try:
+            (magic, version, byte_order, file_size, modification_time,
+             fingerprint, master_count) = self.index_cache_header.unpack_from(data, 0)
+            if (magic != self.index_cache_magic or version != RecordTable.format_version
+                    or byte_order != sys.byteorder[0].encode() or file_size != stat.st_size):
+                return False
+            # Records can be edited in place without changing the size of the file, or its first and last bytes.
+            if modification_time != stat.st_mtime_ns or fingerprint != self._get_fingerprint(file_size):
+                return False
+            _pos = self.index_cache_header.size
+            masters = []
+            for _ in range(master_count):
+                length, = struct.unpack_from('<H', data, _pos)
+                masters += [data[_pos + 2:_pos + 2 + length].decode('utf-8')]
+                _pos += 2 + length
+            self.record_table = RecordTable.from_bytes(memoryview(data)[_pos:])
+        except (struct.error, ValueError):
+            return False
+        self.masters = masters
+        return True
+
+    def _save_index_cache(self, cache_path: str):
+        stat = os.stat(self.file_path)
+        parts = [self.index_cache_header.pack(self.index_cache_magic, RecordTable.format_version,
+                                              sys.byteorder[0].encode(), stat.st_size, stat.st_mtime_ns,
+                                              self._get_fingerprint(stat.st_size), len(self.masters))]
+        for master in self.masters:
+            master_bytes = master.encode('utf-8')
+            parts += [struct.pack('<H', len(master_bytes)), master_bytes]
+        parts.append(self.record_table.to_bytes())
+        temporary_path = None
+        try:
+            os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+            # Write to a temporary file first, so that other processes and threads never read a partial index.
+            file_descriptor, temporary_path = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(cache_path) + '.',
+                                                               dir=os.path.dirname(cache_path) or '.')
+            with open(file_descriptor, 'wb') as cache_file:
+                cache_file.write(b''.join(parts))
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            # The cache is only an optimization. The file is indexed again the next time it is opened.
+            if temporary_path is not None and os.path.exists(temporary_path):
+                os.remove(temporary_path)
 
     def get_record_content(self, record: Union[str, int, Record]) -> bytes:
         try:
@@ -521,21 +1832,408 @@ class ElderScrollsFileReader(Reader):
             self.load_record_content(record)
             return self[record].content
 
-    def load_record_content(self, record: Record):
-        if self[record].is_compressed:
-            content = self._read_bytes(self[record]._pointer + self[record].header_size + 4, self[record].size)
-            content = zlib.decompress(content, zlib.MAX_WBITS)
-        else:
-            content = self._read_bytes(self[record]._pointer + self[record].header_size, self[record].size)
-        record.set_content(content)
-        self[record].content = content
+    def _read_row_content(self, row: int) -> bytes:
+        table = self.record_table
+        if table.flags[row] & Record.compressed_flag:
+            content = self._read_bytes(table.offsets[row] + Record.header_size + 4, table.sizes[row] - 4)
+            return zlib.decompress(content, zlib.MAX_WBITS)
+        return self._read_bytes(table.offsets[row] + Record.header_size, table.sizes[row])
+
+    def load_record_content(self, record: Union[str, int, Record]):
+        row = self._find_row(record)
+        content = self._read_row_content(row)
+        if isinstance(record, Record):
+            record.set_content(content)
+        self._contents[row] = content
+
+    def load_record_contents(self, records, workers: int=None, max_gap: int=4096, max_read_size: int=1 << 24):
+        """Load the contents of many records at once.
+
+        The records are read in the order they appear in the file, and records that
+        are at most max_gap bytes apart are read together, in reads of up to
+        max_read_size bytes. Compressed records are decompressed on workers
+        threads, see _decompress_in_batches.
+
+        Usage example:
+            books = elder_scrolls_file['BOOK']
+            elder_scrolls_file.load_record_contents(books)
+            for book in books:
+                print(book.editor_id)
+        """
+        records = list(records)
+        rows = [self._find_row(record) for record in records]
+        self._load_rows(rows, workers, max_gap, max_read_size)
+        for record, row in zip(records, rows):
+            if isinstance(record, Record):
+                record.set_content(self._contents[row])
+
+    def _load_rows(self, rows, workers: int=None, max_gap: int=4096, max_read_size: int=1 << 24):
+        """Load the contents of the records in rows of the record table, see load_record_contents."""
+        table = self.record_table
+        compressed_rows, compressed_data = [], []
+        for start, end, chunk_rows in self._coalesce_reads(sorted(set(rows), key=table.offsets.__getitem__),
+                                                            max_gap, max_read_size):
+            if self._buffer is not None:
+                chunk = self._view[start:end]
+            else:
+                chunk = memoryview(self._read_bytes(start, end - start))
+            for row in chunk_rows:
+                _pos = table.offsets[row] + Record.header_size - start
+                data = chunk[_pos:_pos + table.sizes[row]]
+                if table.flags[row] & Record.compressed_flag:
+                    compressed_rows += [row]
+                    compressed_data += [data[4:]]
+                else:
+                    self._contents[row] = bytes(data)
+        decompressed = _decompress_in_batches(compressed_data, zlib.decompress, self.decompression_batch_size, workers)
+        self._contents.update(zip(compressed_rows, decompressed))
+
+    def _coalesce_reads(self, rows, max_gap: int, max_read_size: int):
+        """Group rows sorted by offset into (start, end, rows) reads."""
+        table = self.record_table
+        chunk_rows = []
+        for row in rows:
+            start = table.offsets[row]
+            end = start + Record.header_size + table.sizes[row]
+            if chunk_rows and start - chunk_end <= max_gap and end - chunk_start <= max_read_size:
+                chunk_rows += [row]
+                chunk_end = max(chunk_end, end)
+            else:
+                if chunk_rows:
+                    yield chunk_start, chunk_end, chunk_rows
+                chunk_rows = [row]
+                chunk_start, chunk_end = start, end
+        if chunk_rows:
+            yield chunk_start, chunk_end, chunk_rows
 
 
+def iter_records(file_path: str, types: List[str]=None, with_content: bool=True, buffer_size: int=1 << 20):
+    """Iterate over the records in an ESM/P/L file, in file order, without building an index.
+
+    Usage example:
+
+    for record in iter_records(os.path.join(game_folder, 'Data', 'Skyrim.esm'), types=['BOOK', 'NPC_']):
+        print(record.form_id, record.editor_id)
+
+    The file is read from start to end through a buffer of buffer_size bytes,
+    and only one record is held at a time. If with_content is True, each record
+    comes with its content, decompressed if needed. Records of other types are
+    skipped without reading them, as are top-level groups that can only contain
+    other types.
+    """
+    if types is not None:
+        types = {RecordTable.encode_type(record_type) for record_type in types}
+        container_labels = {RecordTable.encode_type(label) for label in ElderScrollsFileReader.container_group_labels}
+    unpack_header = RecordTable.header_structure.unpack
+    group_type_code = RecordTable.encode_type('GRUP')
+    with open(file_path, 'rb', buffering=buffer_size) as file:
+        header = file.read(Record.header_size)
+        if header[0:4] != b'TES4':
+            raise RuntimeError('Incorrect file header - is this a TES4 file?')
+        _pos = 0
+        while len(header) == Record.header_size:
+            type_code, size, flags, form_id, _ = unpack_header(header)
+            if type_code == group_type_code:
+                if size < Group.header_size:
+                    raise RuntimeError(f"Record Group at position {_pos} has an invalid size: {size}")
+                if (types is not None and form_id == 0 and flags not in types
+                        and flags not in container_labels):
+                    file.seek(size - Group.header_size, 1)
+                    _pos += size
+                else:
+                    _pos += Group.header_size
+            elif types is not None and type_code not in types:
+                file.seek(size, 1)
+                _pos += Record.header_size + size
+            else:
+                record = Record(_pos, header)
+                if with_content:
+                    content = file.read(size)
+                    if len(content) != size:
+                        raise RuntimeWarning(f"File ended unexpectedly at position: {_pos}")
+                    if flags & Record.compressed_flag:
+                        content = zlib.decompress(content[4:], zlib.MAX_WBITS)
+                    record._content = content
+                else:
+                    file.seek(size, 1)
+                yield record
+                _pos += Record.header_size + size
+            header = file.read(Record.header_size)
+        if header:
+            raise RuntimeWarning(f"File ended unexpectedly at position: {_pos}")
+
+
+def _read_record_table(file_path: str, cache_folder: str=None, editor_id_index: bool=False) -> bytes:
+    """Scan the headers of a file, and return the serialized record table. Runs in the worker processes of open_many."""
+    with ElderScrollsFileReader(file_path, use_mmap=True, cache_folder=cache_folder,
+                                editor_id_index=editor_id_index) as reader:
+        return reader.record_table.to_bytes()
+
+
+def open_many(file_paths: List[str], workers: int=None, **reader_options) -> List[ElderScrollsFileReader]:
+    """Open several ESM/P/L files, scanning their headers in parallel.
+
+    Usage example:
+
+    readers = open_many([os.path.join(data_folder, name) for name in plugin_names], workers=8)
+
+    The headers are scanned in a pool of worker processes, which send back
+    their record tables as bytes. The readers are then built in this process
+    from those tables, without scanning the files again. The keyword arguments
+    are passed on to ElderScrollsFileReader. If cache_folder is among them,
+    the workers use and update the cache, and if editor_id_index is, the
+    workers also index the editor IDs. The lazy_children and lazy_top_groups
+    arguments have no effect, because every file is fully scanned.
+
+    Pass workers=1 to open the files one after another, in this process.
+    """
+    cache_folder = reader_options.get('cache_folder')
+    editor_id_index = reader_options.get('editor_id_index', False)
+    if workers == 1 or len(file_paths) < 2:
+        return [ElderScrollsFileReader(file_path, **reader_options) for file_path in file_paths]
+    with ProcessPoolExecutor(workers) as executor:
+        record_tables = list(executor.map(_read_record_table, file_paths, [cache_folder] * len(file_paths),
+                                          [editor_id_index] * len(file_paths)))
+    readers = []
+    try:
+        for file_path, record_table in zip(file_paths, record_tables):
+            readers.append(ElderScrollsFileReader(file_path, record_table=RecordTable.from_bytes(record_table),
+                                                  **reader_options))
+    except BaseException:
+        for reader in readers:
+            reader.__exit__(None, None, None)
+        raise
+    return readers
+
+
+class LoadOrder:
+    """Read several plugins in load order, and resolve form IDs across them.
+
+    Usage example:
+
+    with LoadOrder([os.path.join(data_folder, name) for name in ['Skyrim.esm', 'Update.esm', 'Dawnguard.esm']]) as load_order:
+        reader, record = load_order.winning_override(0x13bab)
+        print(reader.file_name, record)  # The last plugin that changes Ysolda.
+
+        for reader, record in load_order.overrides(0x13bab):
+            print(reader.file_name)  # Every plugin that defines or changes Ysolda.
+
+    The mod index in the first byte of a form ID refers to the masters of the
+    plugin that contains the record. Here, form IDs are global: the first byte
+    is the position of the defining plugin among the full plugins in the load
+    order. Records defined in light plugins get global form IDs of the form
+    0xFEnnnooo, where nnn is the position of the plugin among the light plugins
+    and ooo is the 12-bit object index, see FormId.from_indexes. The records
+    that are returned keep the form IDs from their own files. Every plugin must
+    be listed after its masters.
+
+    The keyword arguments, such as use_mmap and cache_folder, are passed on to
+    each ElderScrollsFileReader. Pass workers to scan the plugins in parallel,
+    see open_many.
+    """
+    # Mod index 0xFE is reserved for light plugins, and 0xFF for form IDs created in game.
+    max_plugin_count = FormId.light_mod_index
+    max_light_plugin_count = FormId.max_light_index + 1
+
+    def __init__(self, file_paths: List[str], workers: int=1, **reader_options):
+        self.readers = []
+        self._plugin_indexes = {}
+        # The high bits of the global form IDs of each plugin, and the mask of the object index.
+        self._global_prefixes = {}
+        self._plugin_count = 0
+        self._light_plugin_count = 0
+        # The global form ID, mapped to the last plugin and row that have it. Each entry is packed: plugin << 32 | row.
+        self._winners = {}
+        # The earlier entries of the form IDs that are defined or changed in more than one plugin.
+        self._overridden = {}
+        readers = open_many(file_paths, workers, **reader_options)
+        try:
+            for reader in readers:
+                self._add_plugin(reader)
+        except BaseException:
+            for reader in readers:
+                reader.__exit__(None, None, None)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        self.close()
+
+    def close(self):
+        for reader in self.readers:
+            reader.__exit__(None, None, None)
+
+    def __getitem__(self, form_id: Union[str, int, FormId]) -> Record:
+        return self.winning_override(form_id)[1]
+
+    def __contains__(self, form_id):
+        return ElderScrollsFileReader._get_form_id(form_id) in self._winners
+
+    def __iter__(self):
+        """Iterate over the global form IDs of all the records, in no particular order."""
+        return iter(self._winners)
+
+    def __len__(self):
+        return len(self._winners)
+
+    @property
+    def plugin_names(self) -> List[str]:
+        return [reader.file_name for reader in self.readers]
+
+    def global_form_id(self, reader: ElderScrollsFileReader, form_id: Union[str, int, FormId]) -> int:
+        """Convert a form ID in one of the plugins to a global form ID."""
+        form_id = ElderScrollsFileReader._get_form_id(form_id)
+        prefixes, masks = self._get_mod_index_map(reader)
+        return prefixes[form_id >> 24] | (form_id & masks[form_id >> 24])
+
+    def winning_override(self, form_id: Union[str, int, FormId]) -> tuple:
+        """Return the reader and the record of the last plugin in the load order that has a form ID."""
+        entry = self._winners[ElderScrollsFileReader._get_form_id(form_id)]
+        return self._unpack(entry)
+
+    def overrides(self, form_id: Union[str, int, FormId]) -> list:
+        """Return the readers and the records of every plugin that has a form ID, in load order.
+
+        The first one normally defines the record, and the others change it."""
+        form_id = ElderScrollsFileReader._get_form_id(form_id)
+        entries = self._overridden.get(form_id, []) + [self._winners[form_id]]
+        return [self._unpack(entry) for entry in entries]
+
+    def conflicts(self):
+        """Iterate over the global form IDs that are in more than one plugin."""
+        return iter(self._overridden)
+
+    def _unpack(self, entry: int) -> tuple:
+        reader = self.readers[entry >> 32]
+        return reader, reader.record_at(entry & 0xFFFFFFFF)
+
+    def _get_mod_index_map(self, reader: ElderScrollsFileReader) -> tuple:
+        """Map each mod index in a plugin to the high bits of the global form ID, and to the mask of the object index."""
+        own_prefix = self._global_prefixes[reader.file_name.lower()]
+        prefixes, masks = [own_prefix[0]] * 256, [own_prefix[1]] * 256
+        for i, master in enumerate(reader.masters):
+            prefixes[i], masks[i] = self._global_prefixes[master.lower()]
+        return prefixes, masks
+
+    def _add_plugin(self, reader: ElderScrollsFileReader):
+        plugin_index = len(self.readers)
+        self.readers.append(reader)
+        missing_masters = [master for master in reader.masters if master.lower() not in self._plugin_indexes]
+        if missing_masters:
+            raise RuntimeError(f'{reader.file_name} needs these masters earlier in the load order: {", ".join(missing_masters)}')
+        if reader.is_light:
+            if self._light_plugin_count == self.max_light_plugin_count:
+                raise RuntimeError(f'A load order can have at most {self.max_light_plugin_count} light plugins.')
+            prefix = int(FormId.from_indexes(FormId.light_mod_index, 0, self._light_plugin_count))
+            self._global_prefixes[reader.file_name.lower()] = (prefix, FormId.max_light_object_index)
+            self._light_plugin_count += 1
+        else:
+            if self._plugin_count == self.max_plugin_count:
+                raise RuntimeError(f'A load order can have at most {self.max_plugin_count} full plugins.')
+            self._global_prefixes[reader.file_name.lower()] = (self._plugin_count << 24, 0xFFFFFF)
+            self._plugin_count += 1
+        self._plugin_indexes[reader.file_name.lower()] = plugin_index
+        prefixes, masks = self._get_mod_index_map(reader)
+        master_count = len(reader.masters)
+        own_mask = masks[master_count]
+        reader._scan_pending_groups()
+        winners, overridden = self._winners, self._overridden
+        plugin_entry = plugin_index << 32
+        # The TES4 record in row 0 has the form ID 0 in every plugin, and is not indexed.
+        for row, form_id in enumerate(reader.record_table.form_ids[1:], 1):
+            mod_index = form_id >> 24
+            if mod_index >= master_count and form_id & 0xFFFFFF > own_mask:
+                raise RuntimeError(f'Form ID {hex(form_id)} in the light plugin {reader.file_name} is out of range.')
+            form_id = prefixes[mod_index] | (form_id & masks[mod_index])
+            previous = winners.get(form_id)
+            if previous is not None:
+                overridden.setdefault(form_id, []).append(previous)
+            winners[form_id] = plugin_entry | row
+
+
+
+class _ArchiveFileStream(io.RawIOBase):
+    """A read-only stream of one file in a BSA archive. Compressed files are decompressed as they are read.
+
+    The stored data is read chunk_size bytes at a time, and the decompressor is
+    never asked for more bytes than the caller wants, so memory use is bounded
+    by the chunk size and the size of each read.
+    """
+    chunk_size = 1 << 16
+
+    def __init__(self, archive, start: int, size: int, decompressor=None):
+        self._archive = archive
+        self._pos = start
+        self._end = start + size
+        self._decompressor = decompressor
+        # zlib decompressors keep the input they could not use yet, LZ4 frame decompressors say when they need more.
+        self._keeps_unused_input = not hasattr(decompressor, 'needs_input')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._decompressor is None:
+            data = self._read_input(len(buffer))
+        else:
+            data = self._decompress(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _read_input(self, size: int) -> bytes:
+        data = self._archive._read_bytes(self._pos, min(size, self._end - self._pos))
+        self._pos += len(data)
+        return data
+
+    def _decompress(self, max_length: int) -> bytes:
+        decompressor = self._decompressor
+        while not decompressor.eof:
+            if self._keeps_unused_input:
+                data = decompressor.unconsumed_tail or self._read_input(self.chunk_size)
+                needs_input = not data
+            else:
+                needs_input = decompressor.needs_input
+                data = self._read_input(self.chunk_size) if needs_input else b''
+            if needs_input and not data:
+                raise RuntimeError(f'Compressed file ended unexpectedly in the BSA archive: {self._archive.file_name}')
+            content = decompressor.decompress(data, max_length)
+            if content:
+                return content
+        return b''
+
 
 class BethesdaSoftwareArchiveReader(Reader):
-    """Parse a v104/105 (Skyrim) BSA File."""
+    """Parse a v104/105 (Skyrim) BSA File.
+
+    When the archive is opened, the folder records, the file record blocks and
+    the file names are each read in one go, and kept in arrays. Pass
+    use_mmap=True to memory-map the archive instead of reading it.
+    """
 
+    # Magic, version, offset, archive flags, folder count, file count, total folder name length,
+    # total file name length, file flags and padding.
+    header_structure = struct.Struct('<4sIIIIIIIHH')
+    # Hash, file count and offset. Version 105 has 4 more bytes before a 64-bit offset.
+    folder_record_structures = {104: struct.Struct('<QII'), 105: struct.Struct('<QIIQ')}
+    # Hash, size and offset.
+    file_record_structure = struct.Struct('<QII')
     file_record_length = 16
+    # Bit 30 of the size in a file record flips the default compression of the archive for that file.
+    compression_toggle_flag = 1 << 30
+    file_size_mask = (1 << 30) - 1
+    # Batch size for the decompression of files, see _decompress_in_batches.
+    decompression_batch_size = 1 << 20
+    # extract_all reads the archive in spans of about this many bytes, and writes files through buffers of this size.
+    extraction_read_size = 1 << 22
+    extraction_buffer_size = 1 << 20
+    # extract_all waits for the threads before reading more, when this many bytes are waiting to be written.
+    extraction_bytes_in_flight = 1 << 26
+
+    def __init__(self, file_path, use_mmap: bool=False):
+        super().__init__(file_path)
+        self._use_mmap = use_mmap
 
     class path:
         @staticmethod
@@ -556,8 +2254,9 @@ class BethesdaSoftwareArchiveReader(Reader):
 
     class Folder:
         def __init__(self, folder_index, folder_name, folder_record):
-            folder_hash = BethesdaSoftwareArchiveReader._calculate_hash(folder_name)
-            if folder_hash != folder_record['hash']:
+            if folder_name is not None:
+                folder_hash = BethesdaSoftwareArchiveReader._calculate_hash(folder_name, is_folder=True)
+            if folder_name is not None and folder_hash != folder_record['hash']:
                 raise ValueError(f'Folder name {folder_name} resolves to the hash {folder_hash}, '
                                  f'but the hash in the folder record is {folder_record["hash"]}')
             self.name = folder_name
@@ -604,8 +2303,11 @@ class BethesdaSoftwareArchiveReader(Reader):
 
     def __enter__(self):
         self._file = open(self.file_path, 'rb')
+        if self._use_mmap:
+            self._open_buffer()
+        self._header = self.header_structure.unpack(self._read_bytes(0, self.header_structure.size))
         try:
-            assert self._read_bytes(0, 4) == b'BSA\x00'
+            assert self._header[0] == b'BSA\x00'
         except AssertionError:
             raise RuntimeError(f'Incorrect file header - is {self.file_path} a BSA file?')
 
@@ -622,6 +2324,7 @@ class BethesdaSoftwareArchiveReader(Reader):
         return self
 
     def __exit__(self, exception_type, exception_val, trace):
+        self._close_buffer()
         self._file.close()
 
     def __getitem__(self, key):
@@ -631,15 +2334,14 @@ class BethesdaSoftwareArchiveReader(Reader):
                                 'with a step. Use only one colon in slice, for example: [0:4]')
             return self._read_bytes(key.start, key.stop - key.start)
         elif isinstance(key, tuple):
-            if len(key) >= 2 and [isinstance(key_part, str) for key_part in key]:
-                return self._read_file_by_name(self.path.parse(key[0]), self.path.parse('\\'.join(key[1:])))
+            if len(key) >= 2 and all(isinstance(key_part, str) for key_part in key):
+                return self._read_file_by_name(*self._split_path(*key))
             else:
                 raise KeyError(f"{self.__class__.__name__} allows tuple of two strings to return "
                                 "a file by folder and file name. Example: ['Strings', 'Skyrim_en.dlstrings']")
         elif isinstance(key, str):
-            if '.' in key:
-                key = key.replace('/', '\\').split('\\')
-                return self._read_file_by_name(self.path.parse(key[0]), self.path.parse('\\'.join(key[1:])))
+            if '.' in self._split_path(key)[1]:
+                return self._read_file_by_name(*self._split_path(key))
             else:
                 return self._get_folder(self.path.parse(key))
         elif isinstance(key, int):
@@ -649,56 +2351,328 @@ class BethesdaSoftwareArchiveReader(Reader):
 
     def __contains__(self, key):
         if isinstance(key, tuple):
-            if len(key) >= 2 and [isinstance(key_part, str) for key_part in key]:
-                return bool(self._get_file_index(self.path.parse(key[0]), self.path.parse('\\'.join(key[1:]))))
+            if len(key) >= 2 and all(isinstance(key_part, str) for key_part in key):
+                return self._has_file(*self._split_path(*key))
             else:
                 raise KeyError(f"{self.__class__.__name__} allows tuple of two strings to return "
                                 "a file by folder and file name. Example: ['Strings', 'Skyrim_en.dlstrings']")
         if isinstance(key, int):
             return key in self._folders
         elif isinstance(key, str):
-            hash = self._calculate_hash(self.path.parse(key))
-            return hash in self._folders
-            # TODO: Add files and full paths.
+            folder_name, file_name = self._split_path(key)
+            if '.' in file_name:
+                return self._has_file(folder_name, file_name)
+            try:
+                self._get_folder(self.path.parse(key))
+            except FileNotFoundError:
+                return False
+            return True
         else:
             raise NotImplementedError
 
+    def _split_path(self, *path_parts) -> tuple:
+        """Split a path, given whole or in parts, into the folder name and the file name."""
+        path = self.path.parse('\\'.join(path_parts)).strip('\\')
+        folder_name, _, file_name = path.rpartition('\\')
+        return folder_name, file_name
+
+    def _has_file(self, folder_name, file_name) -> bool:
+        try:
+            self._find_file(folder_name, file_name)
+        except FileNotFoundError:
+            return False
+        return True
+
     def _load_folder_records(self):
+        """Read the folder records and the file record blocks, with one read for each."""
+        folder_record_structure = self.folder_record_structures[self.version]
+        folder_records_size = self.folder_count * folder_record_structure.size
+        folder_records = self._read_bytes(self.offset, folder_records_size)
+        if len(folder_records) != folder_records_size:
+            raise RuntimeError(f'The folder records in the BSA archive {self.file_name} are truncated.')
+        self._folder_hashes = array('Q')
+        self._folder_file_counts = array('I')
+        self._folder_offsets = array('Q')
+        for folder_record in folder_record_structure.iter_unpack(folder_records):
+            self._folder_hashes.append(folder_record[0])
+            self._folder_file_counts.append(folder_record[1])
+            self._folder_offsets.append(folder_record[-1])
+
+        # Each file record block is the folder name as a bstring, if the archive has folder names, then the file records.
+        file_records_start = self.offset + folder_records_size
+        file_records_size = (self.total_folder_name_length + self.folder_count if self.has_folder_names else 0) \
+            + self.file_count * self.file_record_length
+        file_records = memoryview(self._read_bytes(file_records_start, file_records_size))
+        if len(file_records) != file_records_size:
+            raise RuntimeError(f'The file records in the BSA archive {self.file_name} are truncated.')
+        self._file_records_end = file_records_start + file_records_size
+        self._folder_file_starts = array('I')
+        folder_names = []
+        record_blocks = []
+        _pos = 0
+        file_index = 0
+        for folder_index in range(self.folder_count):
+            # The offset in the folder record counts the file names as well, although they come after the file records.
+            if self._folder_offsets[folder_index] - self.total_file_name_length != file_records_start + _pos:
+                raise RuntimeError(f'The file record block of folder {folder_index} is not where its folder record says, '
+                                   f'in the BSA archive {self.file_name}.')
+            if self.has_folder_names:
+                length = file_records[_pos]
+                folder_names += [self._decode_string(file_records[_pos + 1:_pos + length]).rstrip('\0')]
+                _pos += 1 + length
+            else:
+                folder_names += [None]
+            block_size = self._folder_file_counts[folder_index] * self.file_record_length
+            record_blocks += [file_records[_pos:_pos + block_size]]
+            self._folder_file_starts.append(file_index)
+            file_index += self._folder_file_counts[folder_index]
+            _pos += block_size
+        if _pos != file_records_size or file_index != self.file_count:
+            raise RuntimeError(f'File count in the header is {self.file_count} but the folders have {file_index} files.')
+
+        self._file_hashes = array('Q')
+        self._file_sizes = array('I')
+        self._file_offsets = array('I')
+        for file_hash, size, offset in self.file_record_structure.iter_unpack(b''.join(record_blocks)):
+            self._file_hashes.append(file_hash)
+            self._file_sizes.append(size)
+            self._file_offsets.append(offset)
+
+        self._folder_names = folder_names
         self._folders = {}
-        for idx in range(self.folder_count):
-            folder_name = self._get_folder_name_by_index(idx)
+        for idx, folder_name in enumerate(folder_names):
             folder_record = self._get_folder_record_by_index(idx)
             self._folders[folder_record['hash']] = self.Folder(idx, folder_name, folder_record)
 
     def _load_folder_filenames(self):
-        file_names = self._get_file_names()
-        self._folder_filenames = {}
-        i = 0
-        for folder_hash in self._folders:
-            self._folders[folder_hash]._file_names = []
-            while len(self._folders[folder_hash]._file_names) < self._folders[folder_hash]._file_count:
-                self._folders[folder_hash]._file_names += [file_names[i]]
-                i += 1
-        if i != len(file_names):
-            raise RuntimeError(f"Following files are not in a folder: {file_names[i:]}")
+        """Read the file names in one go, and hand them out to the folders."""
+        if self.has_file_names:
+            file_names = self._read_bytes(self._file_records_end, self.total_file_name_length)
+            file_names = [self._decode_string(file_name) for file_name in bytes(file_names).split(b'\0')[:-1]]
+            if len(file_names) != self.file_count:
+                raise RuntimeError(f"File count in the header is {self.file_count} but the list of file names is {len(file_names)}")
+        else:
+            file_names = [None] * self.file_count
+        self._file_names = file_names
+        for folder in self._folders.values():
+            start = self._folder_file_starts[folder.index]
+            folder._file_names = file_names[start:start + folder._file_count]
+
+    def _find_file(self, folder_name, file_name) -> int:
+        """Return the position of a file in the file record arrays.
+
+        The file records of each folder are sorted by hash, so the file is found
+        with a binary search on the hash of its name. The name is compared as
+        well, in case two names in a folder have the same hash."""
+        folder = self._get_folder(folder_name)
+        file_name = file_name.lower()
+        file_hash = self._calculate_hash(file_name)
+        start = self._folder_file_starts[folder.index]
+        end = start + folder._file_count
+        idx = bisect.bisect_left(self._file_hashes, file_hash, start, end)
+        while idx < end and self._file_hashes[idx] == file_hash:
+            if self._file_names[idx] is None or self._file_names[idx].lower() == file_name:
+                return idx
+            idx += 1
+        raise FileNotFoundError(f"The file `{file_name}` not found under the folder `{folder_name}` in the BSA archive: {self.file_name}.")
 
     def _get_file_index(self, folder_name, file_name):
-        folder_hash = self._calculate_hash(folder_name)
-        try:
-            return self._folders[folder_hash]._file_names.index(file_name.lower())
-        except ValueError:
-            raise FileNotFoundError(f"The file `{file_name}` not found under the folder `{folder_name}` in the BSA archive: {self.file_name}.")
+        """Return the position of a file in its folder."""
+        return self._find_file(folder_name, file_name) - self._folder_file_starts[self._get_folder(folder_name).index]
 
     def _read_file_by_name(self, folder_name, file_name):
-        file_record = self._get_file_record_by_name(folder_name, file_name)
+        data, is_compressed = self._read_file_data(self._find_file(folder_name, file_name))
+        if is_compressed:
+            return self._decompress(data)
+        return bytes(data)
+
+    def _read_file_data(self, idx) -> tuple:
+        """Read the stored data of a file, without the embedded name. Return it, and whether it is compressed."""
+        file_record = self._get_file_record(idx)
         file_offset = file_record['offset']
-        file_size = file_record['size']
-        print(self[file_offset - 12:file_offset], self[file_offset:file_offset + 12])
+        data = self._read_bytes(file_offset, file_record['size'])
+        if len(data) != file_record['size']:
+            raise RuntimeError(f'File at position {file_offset} is truncated in the BSA archive: {self.file_name}')
         if self.are_file_names_embedded:
-            raise NotImplementedError
+            # The full path of the file comes first, as a bstring.
+            data = memoryview(data)[1 + data[0]:]
+        return data, file_record['is_compressed']
+
+    def _decompress(self, data) -> bytes:
+        """Decompress the data of a file: the original size, then a zlib stream (v104) or an LZ4 frame (v105)."""
+        original_size, = struct.unpack_from('<I', data, 0)
+        if self.version >= 105:
+            content = self._lz4_frame().decompress(data[4:])
+        else:
+            content = zlib.decompress(data[4:])
+        if len(content) != original_size:
+            raise RuntimeError(f'Decompressed file is {len(content)} bytes instead of {original_size} bytes, '
+                               f'in the BSA archive: {self.file_name}')
+        return content
+
+    @staticmethod
+    def _lz4_frame():
+        """Return the lz4.frame module, which is needed for version 105 archives."""
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError('Version 105 BSA archives are compressed with LZ4. '
+                              'Install it with: pip install tes-reader[lz4]')
+        return lz4.frame
+
+    def view(self, path: str) -> memoryview:
+        """Return the data of an uncompressed file as a memoryview of the memory-mapped archive, without copying it.
+
+        The archive is memory-mapped on the first call, if it was not opened
+        with use_mmap=True. Use open for compressed files."""
+        idx = self._find_file(*self._split_path(path))
+        file_record = self._get_file_record(idx)
         if file_record['is_compressed']:
-            raise NotImplementedError
-        return self[file_offset:file_offset + file_size]
+            raise ValueError(f'The file `{path}` is compressed. Use open to read it as a stream.')
+        if self._buffer is None:
+            self._open_buffer()
+        start, end = file_record['offset'], file_record['offset'] + file_record['size']
+        if self.are_file_names_embedded:
+            start += 1 + self._view[start]
+        return self._view[start:end]
+
+    def open(self, path: str) -> io.BufferedReader:
+        """Open a file in the archive as a binary stream.
+
+        Usage example:
+            with archive.open('textures\\sky\\skyrimcloudsupper04.dds') as texture:
+                header = texture.read(128)
+
+        Compressed files are decompressed while they are read, so the whole file
+        is never held in memory."""
+        idx = self._find_file(*self._split_path(path))
+        file_record = self._get_file_record(idx)
+        start, end = file_record['offset'], file_record['offset'] + file_record['size']
+        if self.are_file_names_embedded:
+            start += 1 + self._read_bytes(start, 1)[0]
+        decompressor = None
+        if file_record['is_compressed']:
+            start += 4  # The original size.
+            if self.version >= 105:
+                decompressor = self._lz4_frame().LZ4FrameDecompressor()
+            else:
+                decompressor = zlib.decompressobj()
+        return io.BufferedReader(_ArchiveFileStream(self, start, end - start, decompressor))
+
+    def extract_many(self, paths: List[str], workers: int=None) -> dict:
+        """Return the contents of many files, keyed by the paths given.
+
+        Usage example:
+            contents = archive.extract_many(['meshes\\actors\\bear\\bear.nif', 'meshes\\actors\\bear\\bearcub.nif'])
+
+        The files are read in the order they are stored in the archive, and the
+        compressed ones are decompressed on workers threads, see
+        _decompress_in_batches.
+        """
+        indexes = {}
+        for path in paths:
+            split_path = self._split_path(*path) if isinstance(path, tuple) else self._split_path(path)
+            indexes[path] = self._find_file(*split_path)
+        contents, compressed_paths, compressed_data = {}, [], []
+        for path in sorted(indexes, key=lambda path: self._file_offsets[indexes[path]]):
+            data, is_compressed = self._read_file_data(indexes[path])
+            if is_compressed:
+                compressed_paths += [path]
+                compressed_data += [data]
+            else:
+                contents[path] = bytes(data)
+        decompressed = _decompress_in_batches(compressed_data, self._decompress, self.decompression_batch_size, workers)
+        contents.update(zip(compressed_paths, decompressed))
+        return {path: contents[path] for path in indexes}
+
+    def extract_all(self, dest: str, pattern: str=None, workers: int=None) -> List[str]:
+        """Extract the files of the archive into the folder dest, and return the paths written.
+
+        Usage example:
+            archive.extract_all('unpacked', pattern='meshes\\actors\\*.nif')
+
+        pattern is a shell-style wildcard, matched against the whole path of
+        each file in the archive. The archive is read in the order the files are
+        stored, in spans of about extraction_read_size bytes. The files in each
+        span are decompressed and written on a thread pool, while the next spans
+        are read, up to extraction_bytes_in_flight bytes ahead of the writes.
+        Use workers=0 to do everything in the calling thread.
+        """
+        if not self.has_folder_names or not self.has_file_names:
+            raise RuntimeError(f'The BSA archive does not contain the names of its files: {self.file_name}')
+        if pattern is not None:
+            pattern = self.path.parse(pattern)
+        dest = os.path.abspath(dest)
+        files = []
+        for folder_idx, folder_name in enumerate(self._folder_names):
+            start = self._folder_file_starts[folder_idx]
+            for idx in range(start, start + self._folder_file_counts[folder_idx]):
+                path = self.path.join([folder_name, self._file_names[idx]])
+                if pattern is None or fnmatch.fnmatchcase(path.lower(), pattern):
+                    target = os.path.abspath(os.path.join(dest, *path.split('\\')))
+                    if not target.startswith(dest + os.sep):
+                        raise RuntimeError(f'The path `{path}` points outside of {dest}, in the BSA archive: {self.file_name}')
+                    files += [(idx, path, target)]
+        files.sort(key=lambda file: self._file_offsets[file[0]])
+
+        if workers == 0:
+            for span in self._read_spans(files):
+                self._write_files(span)
+            return [path for _, path, _ in files]
+        if workers is None:
+            workers = min(32, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(workers) as executor:
+            # Bound the data read but not yet written, so that memory use stays bounded on large archives.
+            in_flight, bytes_in_flight = deque(), 0
+            for span in self._read_spans(files):
+                span_size = sum(len(data) for _, data, _ in span)
+                while in_flight and bytes_in_flight + span_size > self.extraction_bytes_in_flight:
+                    future, size = in_flight.popleft()
+                    future.result()
+                    bytes_in_flight -= size
+                in_flight.append((executor.submit(self._write_files, span), span_size))
+                bytes_in_flight += span_size
+            for future, _ in in_flight:
+                future.result()
+        return [path for _, path, _ in files]
+
+    def _read_spans(self, files: list):
+        """Read files sorted by offset, one span of the archive at a time, and yield them span by span."""
+        span_files = []
+        for file in files:
+            offset = self._file_offsets[file[0]]
+            end = offset + (self._file_sizes[file[0]] & self.file_size_mask)
+            if span_files and end - span_start > self.extraction_read_size:
+                yield self._read_span(span_files, span_start, span_end)
+                span_files = []
+            if not span_files:
+                span_start = offset
+            span_files += [file]
+            span_end = end
+        if span_files:
+            yield self._read_span(span_files, span_start, span_end)
+
+    def _read_span(self, files: list, start: int, end: int) -> list:
+        """Read a span of the archive in one go. Return (target, data, is_compressed) for the files in it."""
+        span = memoryview(self._read_bytes(start, end - start))
+        if len(span) != end - start:
+            raise RuntimeError(f'File at position {start} is truncated in the BSA archive: {self.file_name}')
+        span_files = []
+        for idx, _, target in files:
+            file_record = self._get_file_record(idx)
+            data = span[file_record['offset'] - start:file_record['offset'] - start + file_record['size']]
+            if self.are_file_names_embedded:
+                data = data[1 + data[0]:]
+            span_files += [(target, data, file_record['is_compressed'])]
+        return span_files
+
+    def _write_files(self, files: list):
+        for target, data, is_compressed in files:
+            if is_compressed:
+                data = self._decompress(data)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb', buffering=self.extraction_buffer_size) as output_file:
+                output_file.write(data)
 
 
     @staticmethod
@@ -710,73 +2684,29 @@ class BethesdaSoftwareArchiveReader(Reader):
                 return None
 
     def _get_folder_record_by_index(self, idx):
-        _pos = self.offset + idx * self.folder_record_length
-        _bytes = self[_pos:_pos + self.folder_record_length]
-        _pos_for_offset = 16 if self.version >= 105 else 12
         return {
-            'hash': int.from_bytes(_bytes[0:8], 'little', signed=False),
-            'file_count': int.from_bytes(_bytes[8:12], 'little', signed=False),
-            'offset': int.from_bytes(_bytes[_pos_for_offset:_pos_for_offset + 4], 'little', signed=False),
+            'hash': self._folder_hashes[idx],
+            'file_count': self._folder_file_counts[idx],
+            'offset': self._folder_offsets[idx],
         }
 
     def _get_folder_name_by_index(self, idx):
-        offset = self._get_folder_record_by_index(idx)['offset']
-        return self._read_string(offset - self.total_file_name_length + 1)
-
-    def _get_file_names(self):
-        last_folder_index = self.folder_count - 1
-        last_folder_offset = self._get_folder_record_by_index(last_folder_index)['offset']
-        last_folder_file_count = self._get_folder_record_by_index(last_folder_index)['file_count']
-        file_count = 0
-        for idx in range(self.folder_count):
-            file_count += self._get_folder_record_by_index(idx)['file_count']
-        last_folder_name = self._read_string(last_folder_offset - self.total_file_name_length + 1)
-        file_name_list_offset = last_folder_offset - self.total_file_name_length + 1 + len(last_folder_name) + 1 + last_folder_file_count * self.file_record_length
-        file_names = []
-        while len(file_names) < file_count:
-            file_name = self._read_string(file_name_list_offset)
-            file_name_list_offset += len(file_name) + 1
-            file_names += [file_name]
-        if len(file_names) != self.file_count:
-            raise RuntimeError(f"File count in the header is {self.file_count} but the list of file names is {len(file_names)}")
-        return file_names
-
-    # def _get_files_in_folder_by_index(self, folder_idx):
-    #     folder_record = self._get_folder_record_by_index(folder_idx)
-    #     file_count = folder_record['file_count']
-    #     for file_idx in range(file_count):
-    #         yield self._read_file_record_by_index(folder_idx, file_idx)
-
-    def _read_file_record_bytes(self, folder_idx):
-        folder_offset = self._get_folder_record_by_index(folder_idx)['offset']
-        folder_name = self._read_string(folder_offset - self.total_file_name_length + 1)
-        file_count = self._get_folder_record_by_index(folder_idx)['file_count']
-        file_offset = folder_offset - self.total_file_name_length + 1 + len(folder_name) + 1 + file_count * self.file_record_length
-        _bytes = self[file_offset:file_offset + self.file_record_length]
-        return _bytes
-
-    def _read_file_record_bytes_by_index(self, folder_idx, file_idx):
-        folder_offset = self._get_folder_record_by_index(folder_idx)['offset']
-        folder_name = self._read_string(folder_offset - self.total_file_name_length + 1)
-        file_offset = folder_offset - self.total_file_name_length + 1 + len(folder_name) + 1 + file_idx * self.file_record_length
-        _bytes = self[file_offset:file_offset + self.file_record_length]
-        assert len(_bytes) == 16
-        return _bytes
+        return self._folder_names[idx]
 
     def _read_file_record_by_index(self, folder_idx, file_idx):
-        _bytes = self._read_file_record_bytes_by_index(folder_idx, file_idx)
+        return self._get_file_record(self._folder_file_starts[folder_idx] + file_idx)
+
+    def _get_file_record(self, idx):
+        size = self._file_sizes[idx]
         return {
-            'hash': int.from_bytes(_bytes[0:8], 'little', signed=False),
-            'size': int.from_bytes(_bytes[8:12], 'little', signed=False),
-            'is_compressed': self._get_bit(_bytes[8:12], 29) ^ self.is_compressed_by_default,
-            'offset': int.from_bytes(_bytes[12:16], 'little', signed=False),
+            'hash': self._file_hashes[idx],
+            'size': size & self.file_size_mask,
+            'is_compressed': bool(size & self.compression_toggle_flag) ^ self.is_compressed_by_default,
+            'offset': self._file_offsets[idx],
         }
 
     def _get_file_record_by_name(self, folder_name, file_name):
-        folder = self[folder_name]
-        file_idx = self._get_file_index(folder_name, file_name)
-        file_record = self._read_file_record_by_index(folder.index, file_idx)
-        return file_record
+        return self._get_file_record(self._find_file(folder_name, file_name))
 
     @property
     def folders(self):
@@ -787,21 +2717,21 @@ class BethesdaSoftwareArchiveReader(Reader):
         return [folder.name for folder in self._folders.values()]
 
     @staticmethod
-    def _calculate_hash(path):
+    def _calculate_hash(path, is_folder=False):
         """Returns tes4's two hash values for filename.
 
         Based on the code found at: https://en.uesp.net/wiki/Oblivion_Mod:Hash_Calculation
 
         In turn, based on TimeSlips code with cleanup and pythonization.
+        File names are split into a base and an extension, whatever the extension
+        is. Folder names are hashed whole, even if they contain a dot.
         """
         extensions = {'.kf': 0x80, '.nif': 0x8000, '.dds': 0x8080, '.wav': 0x80000000}
         path = path.lower()
-        if any([path.endswith(ext) for ext in extensions]):
-            ext = '.' + path.lower().split('.')[-1]
-            base = path[:-len(ext)]
+        if is_folder:
+            base, ext = path, ''
         else:
-            ext = ''
-            base = path
+            base, ext = ntpath.splitext(path)
 
         chars = list(map(ord, base))
         hash1 = chars[-1] | (chars[-2] if len(chars) > 2 else 0) << 8 | len(chars) << 16 | chars[0] << 24
@@ -827,7 +2757,10 @@ class BethesdaSoftwareArchiveReader(Reader):
     def _get_folder(self, folder_name):
         folder_name = folder_name.lower()
         folder_name = folder_name.strip('\\')
-        hash = self._calculate_hash(folder_name)
+        if not folder_name:
+            # Every file in an archive is in a folder, and an empty name has no hash.
+            raise FileNotFoundError(f'A folder name is needed to find a file in the BSA archive: {self.file_name}')
+        hash = self._calculate_hash(folder_name, is_folder=True)
         if hash not in self._folders:
             raise FileNotFoundError(f'Folder `{folder_name}` not found in the BSA archive: {self.file_name}')
         return self._get_folder_by_hash(hash)
@@ -835,50 +2768,50 @@ class BethesdaSoftwareArchiveReader(Reader):
 
     @property
     def version(self):
-        return int.from_bytes(self[4:8], 'little', signed=False)
+        return self._header[1]
 
     @property
     def offset(self):
-        return int.from_bytes(self[8:12], 'little', signed=False)
+        return self._header[2]
 
     @property
     def folder_count(self):
-        return int.from_bytes(self[16:20], 'little', signed=False)
+        return self._header[4]
 
     @property
     def file_count(self):
-        return int.from_bytes(self[20:24], 'little', signed=False)
+        return self._header[5]
 
     @property
     def total_folder_name_length(self):
-        return int.from_bytes(self[24:28], 'little', signed=False)
+        return self._header[6]
 
     @property
     def total_file_name_length(self):
-        return int.from_bytes(self[28:32], 'little', signed=False)
+        return self._header[7]
 
     @property
     def has_folder_names(self):
-        return self._get_bit(self[12:16], 0)
+        return bool(self._header[3] & 1)
 
     @property
     def has_file_names(self):
-        return self._get_bit(self[12:16], 1)
+        return bool(self._header[3] >> 1 & 1)
 
     @property
     def is_compressed_by_default(self):
-        return self._get_bit(self[12:16], 2)
+        return bool(self._header[3] >> 2 & 1)
 
     @property
     def are_file_names_embedded(self):
-        return self._get_bit(self[12:16], 8)
+        return bool(self._header[3] >> 8 & 1)
 
     @property
     def contains_meshes(self):
-        return self._get_bit(self[30:32], 0)
+        return bool(self._header[8] & 1)
 
     @property
     def contains_textures(self):
-        return self._get_bit(self[30:32], 1)
+        return bool(self._header[8] >> 1 & 1)
 
 
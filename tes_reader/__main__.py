@@ -0,0 +1,50 @@
+"""Command line tools for TES files.
+
+Usage Example - Unpack the meshes of the actors from a BSA archive
+    python -m tes_reader extract "Skyrim - Meshes0.bsa" unpacked --pattern "meshes\\actors\\*"
+"""
+import sys
+import argparse
+
+from tes_reader import BethesdaSoftwareArchiveReader
+
+
+def extract(args):
+    with BethesdaSoftwareArchiveReader(args.archive) as archive:
+        paths = archive.extract_all(args.dest, pattern=args.pattern, workers=args.workers)
+    if args.verbose:
+        for path in paths:
+            print(path)
+    print(f'Extracted {len(paths)} files to {args.dest}', file=sys.stderr)
+
+
+def list_files(args):
+    with BethesdaSoftwareArchiveReader(args.archive) as archive:
+        for folder in archive.folders:
+            for file_name in folder:
+                print(f'{folder.name}\\{file_name}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tes-reader', description='Read TES (The Elder Scrolls) files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    extract_parser = commands.add_parser('extract', help='Extract the files of a BSA archive into a folder.')
+    extract_parser.add_argument('archive', help='Path to the BSA archive.')
+    extract_parser.add_argument('dest', help='Folder to extract into.')
+    extract_parser.add_argument('--pattern', help='Only extract the files whose path matches this wildcard.')
+    extract_parser.add_argument('--workers', type=int, default=None,
+                                help='Number of threads that decompress and write files. 0 to use no threads.')
+    extract_parser.add_argument('--verbose', '-v', action='store_true', help='Print the path of every file extracted.')
+    extract_parser.set_defaults(function=extract)
+
+    list_parser = commands.add_parser('list', help='List the files in a BSA archive.')
+    list_parser.add_argument('archive', help='Path to the BSA archive.')
+    list_parser.set_defaults(function=list_files)
+
+    args = parser.parse_args(argv)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,79 +1,194 @@
 import struct
+from collections import namedtuple
+from typing import List, Tuple
 from . import Record, FormId, debug_record_attribute
 
+
+class FieldLayout:
+    """The layout of a fixed-size field, compiled once into a struct and a named tuple.
+
+    Usage example:
+        ACBS = FieldLayout('ACBS', [('flags', 'I'), ('magicka_offset', 'h'), ...])
+        ACBS.decode(npc.get_first('ACBS')).flags
+
+    The layout is a list of (name, format) pairs, with the formats of the struct
+    module. Padding ('x') has no name. Fields longer than the layout are decoded
+    from the start, because later versions of the game append to some fields.
+    """
+    __slots__ = ('name', 'layout', 'structure', 'tuple_type')
+    # Struct formats and the matching NumPy types.
+    numpy_types = {'b': 'i1', 'B': 'u1', 'h': '<i2', 'H': '<u2', 'i': '<i4', 'I': '<u4',
+                   'q': '<i8', 'Q': '<u8', 'f': '<f4', 'd': '<f8', 's': 'S'}
+
+    def __init__(self, name: str, layout: List[Tuple[str, str]]):
+        self.name = name
+        self.layout = layout
+        self.structure = struct.Struct('<' + ''.join(fmt for _, fmt in layout))
+        self.tuple_type = namedtuple(name, [attribute for attribute, fmt in layout if attribute])
+
+    def decode(self, data: bytes) -> tuple:
+        try:
+            return self.tuple_type._make(self.structure.unpack_from(data))
+        except struct.error:
+            raise RuntimeError(f'{self.name} field is {len(data)} bytes, expected at least {self.structure.size}.')
+
+    def decode_all(self, fields: List[bytes]) -> list:
+        """Decode many fields. Fields that are None stay None."""
+        size = self.structure.size
+        if all(data is not None and len(data) == size for data in fields):
+            # All fields have exactly the size of the layout, so unpack them in one pass.
+            return list(map(self.tuple_type._make, self.structure.iter_unpack(b''.join(fields))))
+        return [None if data is None else self.decode(data) for data in fields]
+
+    def numpy_dtype(self):
+        """Return a NumPy structured dtype with the same layout. Needs NumPy."""
+        import numpy
+        names, formats, offsets = [], [], []
+        offset = 0
+        for attribute, fmt in self.layout:
+            if attribute:
+                numpy_type = self.numpy_types[fmt[-1]]
+                names += [attribute]
+                formats += [numpy_type + fmt[:-1] if fmt[-1] == 's' else numpy_type]
+                offsets += [offset]
+            offset += struct.calcsize('<' + fmt)
+        return numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': offset})
+
+
+FORM_ID = [('form_id', 'I')]
+
+# See https://en.uesp.net/wiki/Skyrim_Mod:Mod_File_Format for the layouts.
+schemas = {
+    'NPC_': {
+        'ACBS': FieldLayout('ACBS', [('flags', 'I'), ('magicka_offset', 'h'), ('stamina_offset', 'h'),
+                                     ('level', 'H'), ('calc_min_level', 'H'), ('calc_max_level', 'H'),
+                                     ('speed_multiplier', 'H'), ('disposition_base', 'h'),
+                                     ('template_data_flags', 'H'), ('health_offset', 'h'),
+                                     ('bleedout_override', 'H')]),
+        'RNAM': FieldLayout('RNAM', FORM_ID),
+        'CNAM': FieldLayout('CNAM', FORM_ID),
+    },
+    'RACE': {
+        'DATA': FieldLayout('RaceData', [('skill_boosts', '14s'), ('', '2x'), ('male_height', 'f'),
+                                         ('female_height', 'f'), ('male_weight', 'f'), ('female_weight', 'f'),
+                                         ('flags', 'I'), ('starting_health', 'f'), ('starting_magicka', 'f'),
+                                         ('starting_stamina', 'f'), ('base_carry_weight', 'f'),
+                                         ('base_mass', 'f'), ('acceleration_rate', 'f'),
+                                         ('deceleration_rate', 'f'), ('size', 'I'),
+                                         ('head_biped_object', 'i'), ('hair_biped_object', 'i'),
+                                         ('injured_health_percentage', 'f'), ('shield_biped_object', 'i'),
+                                         ('health_regeneration', 'f'), ('magicka_regeneration', 'f'),
+                                         ('stamina_regeneration', 'f'), ('unarmed_damage', 'f'),
+                                         ('unarmed_reach', 'f'), ('body_biped_object', 'i'),
+                                         ('aim_angle_tolerance', 'f'), ('flight_radius', 'f'),
+                                         ('angular_acceleration_rate', 'f'), ('angular_tolerance', 'f'),
+                                         ('flags2', 'I')]),
+    },
+    'BOOK': {
+        'DATA': FieldLayout('BookData', [('flags', 'B'), ('book_type', 'B'), ('', '2x'),
+                                         ('teaches', 'I'), ('value', 'I'), ('weight', 'f')]),
+    },
+    'CLAS': {
+        'DATA': FieldLayout('ClassData', [('unknown', 'I'), ('teaches', 'b'), ('max_training_level', 'B'),
+                                          ('skill_weights', '18s'), ('bleedout_default', 'f'),
+                                          ('voice_points', 'I'), ('health_weight', 'B'),
+                                          ('magicka_weight', 'B'), ('stamina_weight', 'B'), ('flags', 'B')]),
+    },
+}
+
+
+def decode_fields(records: List[Record], field_name: str) -> list:
+    """Decode the first field with the name in each record, using the schema of the record type.
+
+    The records need to have their content loaded, and to all be of the same type.
+    Records without the field give None."""
+    if not records:
+        return []
+    layout = schemas[records[0].type][field_name]
+    return layout.decode_all([record.get_first(field_name) for record in records])
+
+
 class NPC(Record):
     """A class to represent NPC_ type records.
 
     These records contain information about non-player characters (NPCs)."""
+    __slots__ = ()
+    schema = schemas['NPC_']
+
     def __init__(self, record):
-        self._pointer = record._pointer
-        self._header = record._header
+        super().__init__(record._pointer, record._header)
         self._content = record.content
 
     @property
     def class_id(self):
-        for class_field in self['CNAM']:
-            return FormId(class_field)
+        class_field = self.decode('CNAM')
+        if class_field is not None:
+            return FormId(class_field.form_id)
 
     @property
     def race_id(self):
-        for race_field in self['RNAM']:
-            return FormId(race_field)
+        race_field = self.decode('RNAM')
+        if race_field is not None:
+            return FormId(race_field.form_id)
 
     @property
     def acbs(self):
-        for acbs_field in self['ACBS']:
-            return acbs_field
+        return self.get_first('ACBS')
+
+    def _get_acbs_flag(self, bit: int):
+        acbs = self.decode('ACBS')
+        if acbs is not None:
+            return bool(acbs.flags >> bit & 1)
 
     @property
     @debug_record_attribute
     def is_female(self):
-        return self._get_bit(self.acbs, 0)
+        return self._get_acbs_flag(0)
 
     @property
     @debug_record_attribute
     def is_essential(self):
-        return self._get_bit(self.acbs, 1)
+        return self._get_acbs_flag(1)
 
     @property
     def is_preset(self):
-        return self._get_bit(self.acbs, 2)
+        return self._get_acbs_flag(2)
 
     @property
     def respawns(self):
-        return self._get_bit(self.acbs, 3)
+        return self._get_acbs_flag(3)
 
     @property
     def auto_calculate_stats(self):
-        return self._get_bit(self.acbs, 4)
+        return self._get_acbs_flag(4)
 
     @property
     def is_unique(self):
-        return self._get_bit(self.acbs, 5)
+        return self._get_acbs_flag(5)
 
     @property
     def is_levelling_up_with_pc(self):
-        return self._get_bit(self.acbs, 7)
+        return self._get_acbs_flag(7)
 
     @property
     def is_protected(self):
-        return self._get_bit(self.acbs, 11)
+        return self._get_acbs_flag(11)
 
     @property
     def is_summonable(self):
-        return self._get_bit(self.acbs, 14)
+        return self._get_acbs_flag(14)
 
     @property
     def has_opposite_gender_animations(self):
-        return self._get_bit(self.acbs, 19)
+        return self._get_acbs_flag(19)
 
     @property
     def is_ghost(self):
-        return self._get_bit(self.acbs, 29)
+        return self._get_acbs_flag(29)
 
     @property
     def is_invulnerable(self):
-        return self._get_bit(self.acbs, 31)
+        return self._get_acbs_flag(31)
 
     @property
     def level(self):
@@ -81,7 +196,7 @@ class NPC(Record):
             divider = 1000
         else:
             divider = 1
-        return int.from_bytes(self.acbs[8:10], 'little', signed=False) / divider
+        return self.decode('ACBS').level / divider
 
     @property
     def face_geom_file_name(self) -> str:
@@ -116,53 +231,58 @@ class Book(Record):
     """A class to represent BOOK type records.
 
     These records contain information about books."""
+    __slots__ = ()
+    schema = schemas['BOOK']
+
     def __init__(self, record):
-        self._pointer = record._pointer
-        self._header = record._header
+        super().__init__(record._pointer, record._header)
         self._content = record.content
 
 class Race(Record):
     """A class to represent RACE type records.
 
     These records contain information about character races."""
+    __slots__ = ()
+    schema = schemas['RACE']
+
     def __init__(self, record):
-        self._pointer = record._pointer
-        self._header = record._header
+        super().__init__(record._pointer, record._header)
         self._content = record.content
 
     @property
     def data(self):
-        for data_field in self['DATA']:
-            return data_field
+        return self.get_first('DATA')
 
     @property
     def male_height(self):
-        return struct.unpack('f', self.data[16:20])[0]
+        return self.decode('DATA').male_height
 
     @property
     def female_height(self):
-        return struct.unpack('f', self.data[20:24])[0]
+        return self.decode('DATA').female_height
 
     @property
     def male_weight(self):
-        return struct.unpack('f', self.data[24:28])[0]
+        return self.decode('DATA').male_weight
 
     @property
     def female_weight(self):
-        return struct.unpack('f', self.data[28:32])[0]
+        return self.decode('DATA').female_weight
 
     @property
     def is_playable(self):
-        return self._get_bit(self.data[32:36], 0)
+        return bool(self.decode('DATA').flags & 1)
 
 
 class CharacterClass(Record):
     """A class to represent CLAS type records.
 
     These records contain information about character classes."""
+    __slots__ = ()
+    schema = schemas['CLAS']
+
     def __init__(self, record):
-        self._pointer = record._pointer
-        self._header = record._header
+        super().__init__(record._pointer, record._header)
         self._content = record.content
 
 
@@ -170,12 +290,14 @@ class Info(Record):
     """A class to represent INFO type records.
 
     These records contain information about dialogue responses of Voice Types."""
+    __slots__ = ()
+
     # TODO: Add a unit test for this type of record
     def __init__(self, record):
-        self._pointer = record._pointer
-        self._header = record._header
+        super().__init__(record._pointer, record._header)
         self._content = record.content
 
     def __str__(self):
-        for content in self['NAM1']:
+        content = self.get_first('NAM1')
+        if content is not None:
             return content[:-1].decode('ascii')
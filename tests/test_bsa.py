@@ -1,5 +1,6 @@
 import pytest
 import os
+import hashlib
 from configparser import ConfigParser
 from tes_reader import BethesdaSoftwareArchiveReader
 
@@ -78,3 +79,137 @@ def test_get_file_contents_with_index_string_and_forward_slash():
         assert number_of_entries == 2686
         total_length = int.from_bytes(file_bytes[4:8], 'little', signed=False)
         assert total_length == 2421653
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_file_tables(test_file):
+    assert len(test_file.folders) == test_file.folder_count
+    assert sum(len(folder) for folder in test_file.folders) == test_file.file_count
+    assert 'skyrim_english.dlstrings' in test_file['Strings']
+    with BethesdaSoftwareArchiveReader(test_filename, use_mmap=True) as mapped_file:
+        assert mapped_file.folder_names == test_file.folder_names
+        for folder, mapped_folder in zip(test_file.folders, mapped_file.folders):
+            assert list(folder) == list(mapped_folder)
+        assert mapped_file['Strings', 'Skyrim_English.dlstrings'] == test_file['Strings', 'Skyrim_English.dlstrings']
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_find_files_by_hash(test_file):
+    for folder in test_file.folders:
+        for file_name in folder:
+            assert (folder.name, file_name) in test_file
+            assert f'{folder.name}\\{file_name}' in test_file
+            assert test_file._calculate_hash(file_name) == test_file._get_file_record_by_name(folder.name, file_name)['hash']
+    assert ('Strings', 'NonExistingFile.dlstrings') not in test_file
+    assert 'Strings/NonExistingFile.dlstrings' not in test_file
+    assert 'strings' in test_file
+    assert 'readme.txt' not in test_file
+    assert '' not in test_file
+    with pytest.raises(FileNotFoundError):
+        test_file['readme.txt']
+
+meshes_filename = os.path.join(config['Skyrim']['Folder'],
+                               'Data',
+                               'Skyrim - Meshes0.bsa')
+
+# The archives of the original Skyrim (Legendary Edition) are version 104, compressed with zlib.
+legendary_edition_meshes_filename = None
+if config.has_option('Skyrim LE', 'Folder'):
+    legendary_edition_meshes_filename = os.path.join(config['Skyrim LE']['Folder'],
+                                                     'Data',
+                                                     'Skyrim - Meshes.bsa')
+
+def test_extract_compressed_files():
+    pytest.importorskip('lz4')
+    with BethesdaSoftwareArchiveReader(meshes_filename) as meshes_file:
+        assert meshes_file.is_compressed_by_default
+        paths = [f'{folder.name}\\{file_name}' for folder in meshes_file.folders[:3] for file_name in folder]
+        contents = meshes_file.extract_many(paths, workers=4)
+        assert list(contents) == paths
+        assert contents == meshes_file.extract_many(paths, workers=0)
+        for path in paths[:20]:
+            assert meshes_file[path] == contents[path]
+            assert len(contents[path]) > 0
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_view_and_stream_files(test_file):
+    path = 'Strings\\Skyrim_English.dlstrings'
+    view = test_file.view(path)
+    assert isinstance(view, memoryview)
+    assert view == test_file[path]
+    with test_file.open(path) as stream:
+        assert stream.read(4) + stream.read() == test_file[path]
+
+def test_stream_compressed_files():
+    pytest.importorskip('lz4')
+    with BethesdaSoftwareArchiveReader(meshes_filename) as meshes_file:
+        folder = meshes_file.folders[0]
+        path = f'{folder.name}\\{list(folder)[0]}'
+        with pytest.raises(ValueError):
+            meshes_file.view(path)
+        digest = hashlib.sha1()
+        with meshes_file.open(path) as stream:
+            for chunk in iter(lambda: stream.read(1 << 12), b''):
+                digest.update(chunk)
+        assert digest.digest() == hashlib.sha1(meshes_file[path]).digest()
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_extract_all(test_file, tmp_path):
+    paths = test_file.extract_all(tmp_path, pattern='strings\\*.dlstrings', workers=2)
+    assert [path.lower() for path in paths] == ['strings\\skyrim_english.dlstrings']
+    for path in paths:
+        with open(os.path.join(tmp_path, *path.split('\\')), 'rb') as extracted_file:
+            assert extracted_file.read() == test_file[path]
+
+def test_extract_all_compressed(tmp_path):
+    pytest.importorskip('lz4')
+    from tes_reader.__main__ import main
+    main(['extract', meshes_filename, str(tmp_path), '--workers', '0'])
+    with BethesdaSoftwareArchiveReader(meshes_filename) as meshes_file:
+        paths = [f'{folder.name}\\{file_name}' for folder in meshes_file.folders for file_name in folder]
+        assert len(paths) == meshes_file.file_count
+        for path in paths[:50]:
+            with open(os.path.join(tmp_path, *path.split('\\')), 'rb') as extracted_file:
+                assert extracted_file.read() == meshes_file[path]
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_non_ascii_file_names(test_file, tmp_path):
+    file_name = test_file.folders[0]._file_names[0]
+    with open(test_filename, 'rb') as archive_file:
+        data = bytearray(archive_file.read())
+    # Replace the first letter of the name with a latin-1 (cp1252) é, which is not valid UTF-8.
+    name_position = data.index(file_name.encode('utf-8') + b'\0', test_file._file_records_end)
+    data[name_position] = 0xE9
+    patched_filename = tmp_path / 'Patched.bsa'
+    patched_filename.write_bytes(bytes(data))
+    with BethesdaSoftwareArchiveReader(str(patched_filename)) as patched_file:
+        assert patched_file.folders[0]._file_names[0] == '\xe9' + file_name[1:]
+
+def test_extract_all_with_little_memory(tmp_path):
+    pytest.importorskip('lz4')
+    with BethesdaSoftwareArchiveReader(meshes_filename) as meshes_file:
+        meshes_file.extraction_read_size = 1 << 12
+        meshes_file.extraction_bytes_in_flight = 1 << 14
+        paths = meshes_file.extract_all(tmp_path, workers=4)
+        assert len(paths) == meshes_file.file_count
+        for path in paths[::25]:
+            with open(os.path.join(tmp_path, *path.split('\\')), 'rb') as extracted_file:
+                assert extracted_file.read() == meshes_file[path]
+
+def test_version_104_compressed_files(tmp_path):
+    if legendary_edition_meshes_filename is None:
+        pytest.skip('Set Folder in the [Skyrim LE] section of test.ini to test version 104 archives.')
+    with BethesdaSoftwareArchiveReader(legendary_edition_meshes_filename) as meshes_file:
+        assert meshes_file.version == 104
+        assert meshes_file.is_compressed_by_default
+        paths = [f'{folder.name}\\{file_name}' for folder in meshes_file.folders[:3] for file_name in folder]
+        contents = meshes_file.extract_many(paths, workers=4)
+        assert contents == meshes_file.extract_many(paths, workers=0)
+        for path in paths[:20]:
+            assert len(contents[path]) > 0
+            with meshes_file.open(path) as stream:
+                assert stream.read(7) + stream.read() == contents[path]
+        folder = meshes_file.folders[0]
+        extracted_paths = meshes_file.extract_all(tmp_path, pattern=f'{folder.name}\\*', workers=2)
+        assert set(f'{folder.name}\\{file_name}' for file_name in folder) <= set(extracted_paths)
+        for path in extracted_paths[:20]:
+            with open(os.path.join(tmp_path, *path.split('\\')), 'rb') as extracted_file:
+                assert extracted_file.read() == meshes_file[path]
@@ -34,3 +34,42 @@ def test_form_id_for_ysolda():
     assert len(form_id) == 4
     assert str(form_id) == '0x13bab'
     assert str(form_id.objectindex) == '0x13bab'
+
+def test_light_form_id():
+    form_id = FormId(b'\x01\x58\x03\xfe')
+    assert form_id.is_light
+    assert form_id.light_index == 0x35
+    assert form_id.objectindex == FormId(b'\x01\x08\x00')
+    assert FormId.from_indexes(0xfe, 0x801, light_index=0x35) == FormId(b'\x01\x58\x03\xfe')
+    assert not FormId('0x0013bab').is_light
+    assert FormId('0x0013bab').light_index is None
+
+def test_light_form_id_errors():
+    with pytest.raises(ValueError):
+        FormId.from_indexes(0xfe, 0x1000, light_index=0)  # Light object indexes have 12 bits.
+    with pytest.raises(ValueError):
+        FormId.from_indexes(0xfe, 0x800, light_index=0x1000)
+    with pytest.raises(ValueError):
+        FormId.from_indexes(0x01, 0x800, light_index=0)
+    with pytest.raises(ValueError):
+        FormId.from_indexes(0x100, 0x800)
+
+def test_form_id_as_key():
+    form_id = FormId(b'\xab\x3b\x01\x00')
+    assert form_id == 0x13bab
+    assert form_id == '0x13bab'
+    assert form_id == b'\xab\x3b\x01\x00'
+    assert {form_id: 'Ysolda'}[0x13bab] == 'Ysolda'
+    assert {0x13bab: 'Ysolda'}[form_id] == 'Ysolda'
+    assert FormId(0x13bab) in {form_id}
+    assert FormId(0x7) < form_id <= 0x13bab
+    assert sorted([form_id, FormId('0x7')]) == [0x7, 0x13bab]
+    assert f'{form_id}' == '0x13bab'
+    assert f'{form_id:08x}' == '00013bab'
+
+def test_form_id_arrays():
+    form_ids = FormId.unpack_all(b'\xab\x3b\x01\x00\x01\x08\x00\x02')
+    assert list(form_ids) == [0x13bab, 0x2000801]
+    assert list(FormId.mod_indexes(form_ids)) == [0, 2]
+    assert list(FormId.object_indexes(form_ids)) == [0x13bab, 0x801]
+    assert FormId.from_ints(form_ids) == [FormId('0x0013bab'), FormId('0x2000801')]
@@ -1,8 +1,8 @@
 import pytest
 import os
 from configparser import ConfigParser
-from tes_reader import ElderScrollsFileReader
-from tes_reader.record_types import NPC
+from tes_reader import ElderScrollsFileReader, FormId, LoadOrder, iter_records, open_many
+from tes_reader.record_types import NPC, Race, decode_fields
 from tes_reader import is_type
 
 config = ConfigParser()
@@ -59,3 +59,382 @@ def test_load_npc_record_content(test_file):
     print([f.name for f in npc])
     print([n for n in npc['FULL']])
     assert npc.full_name == "Ysolda"
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_open_file_with_mmap(test_file):
+    with ElderScrollsFileReader(test_filename, use_mmap=True) as mapped_file:
+        assert mapped_file[0:4] == b'TES4'
+        assert len(mapped_file) == len(test_file)
+        assert mapped_file.record_types == test_file.record_types
+        assert mapped_file.masters == test_file.masters
+        form_id = '0x13bab'  # Ysolda
+        assert str(mapped_file[form_id].form_id) == form_id
+        assert mapped_file.get_record_content(form_id) == test_file.get_record_content(form_id)
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_iterate_records_by_type(test_file):
+    assert 'NPC_' in test_file
+    assert 'XXXX' not in test_file
+    books = list(test_file.iter_type('BOOK'))
+    assert books == test_file['BOOK']
+    assert all(book.type == 'BOOK' for book in books)
+    assert list(test_file.iter_type('XXXX')) == []
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_iterate_records_by_top_level_group(test_file):
+    assert {'BOOK', 'NPC_', 'CELL'} <= test_file.group_labels
+    cell_group_types = {record.type for record in test_file.iter_group('CELL')}
+    assert {'CELL', 'REFR'} <= cell_group_types
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_record_table(test_file):
+    table = test_file.record_table
+    assert len(table) == len(test_file)
+    npc_rows = list(table.rows('NPC_'))
+    assert len(npc_rows) == len(test_file['NPC_'])
+    for row in npc_rows[:100]:
+        record = test_file.record_at(row)
+        assert record.type == 'NPC_'
+        assert int(record.form_id) == table.form_ids[row]
+        assert record.size == table.sizes[row]
+    for row in table.rows('NPC_', flag=18):
+        assert test_file.record_at(row).is_compressed
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_index_cache(test_file, tmp_path):
+    with ElderScrollsFileReader(test_filename, cache_folder=str(tmp_path)) as cold_file:
+        assert len(cold_file) == len(test_file)
+    assert len(list(tmp_path.iterdir())) == 1
+    with ElderScrollsFileReader(test_filename, cache_folder=str(tmp_path)) as warm_file:
+        assert warm_file.record_table.form_ids == test_file.record_table.form_ids
+        assert sorted(warm_file.record_table.offsets) == sorted(test_file.record_table.offsets)
+        assert warm_file.record_types == test_file.record_types
+        assert warm_file.masters == test_file.masters
+        assert len(warm_file['NPC_']) == len(test_file['NPC_'])
+        assert warm_file['0x13bab'].type == 'NPC_'
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_index_cache_is_stale_when_file_is_modified(tmp_path, monkeypatch):
+    with ElderScrollsFileReader(test_filename, cache_folder=str(tmp_path)):
+        pass
+    cache_path, = tmp_path.iterdir()
+    # Pretend that the file was modified in place: same size, same first and last bytes.
+    data = bytearray(cache_path.read_bytes())
+    header = list(ElderScrollsFileReader.index_cache_header.unpack_from(data, 0))
+    header[4] -= 1
+    ElderScrollsFileReader.index_cache_header.pack_into(data, 0, *header)
+    cache_path.write_bytes(bytes(data))
+    scans = []
+    read_all_record_headers = ElderScrollsFileReader._read_all_record_headers
+    monkeypatch.setattr(ElderScrollsFileReader, '_read_all_record_headers',
+                        lambda reader: scans.append(reader) or read_all_record_headers(reader))
+    with ElderScrollsFileReader(test_filename, cache_folder=str(tmp_path)):
+        assert len(scans) == 1
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_index_cache_cannot_be_written(test_file, tmp_path):
+    not_a_folder = tmp_path / 'cache'
+    not_a_folder.write_bytes(b'')
+    with ElderScrollsFileReader(test_filename, cache_folder=str(not_a_folder)) as elder_scrolls_file:
+        assert len(elder_scrolls_file) == len(test_file)
+    assert [path.name for path in tmp_path.iterdir()] == ['cache']
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_fields_are_parsed_after_content_is_loaded():
+    with ElderScrollsFileReader(test_filename) as elder_scrolls_file:
+        record = elder_scrolls_file['NPC_'][0]
+        with pytest.raises(AttributeError):
+            record.get_all('EDID')
+        elder_scrolls_file.load_record_content(record)
+        editor_id = record.editor_id
+        assert editor_id is not None
+        assert len(record.get_all('EDID')) == 1
+        new_editor_id = b'Renamed' + bytes(len(editor_id) - len('Renamed') + 1)
+        record.content = record.content.replace(editor_id.encode('utf-8') + b'\0', new_editor_id)
+        assert record.editor_id == 'Renamed'
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_load_record_contents(test_file):
+    with ElderScrollsFileReader(test_filename) as elder_scrolls_file:
+        npc_records = elder_scrolls_file['NPC_']
+        elder_scrolls_file.load_record_contents(npc_records, workers=4)
+        for npc_record in npc_records[:500]:
+            assert npc_record.content == test_file.get_record_content(npc_record)
+            assert elder_scrolls_file[npc_record].content == npc_record.content
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_parse_fields(test_file):
+    content = test_file.get_record_content('0x13bab')  # Ysolda
+    record = test_file['0x13bab']
+    fields = list(record)
+    assert fields[0].name == 'EDID'
+    assert str(fields[0]) == 'Ysolda'
+    assert bytes(fields[0]) == next(record['EDID'])
+    assert sum(len(field) for field in fields) == len(content)
+    assert record.field_types == {field.name for field in fields}
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_get_fields_by_name(test_file):
+    record = test_file['0x13bab']  # Ysolda
+    test_file.load_record_content(record)
+    npc = NPC(record)
+    assert 'EDID' in npc
+    assert 'XXXX' not in npc
+    assert npc.get_first('EDID') == b'Ysolda\x00'
+    assert npc.get_all('EDID') == [b'Ysolda\x00']
+    assert npc.get_first('XXXX') is None
+    assert npc.get_all('XXXX') == []
+    assert npc.full_name == 'Ysolda'
+    assert npc.acbs == next(npc['ACBS'])
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_parse_oversized_fields(test_file):
+    records = test_file['WRLD'] + test_file['NAVM'][:100]
+    test_file.load_record_contents(records)
+    for record in records:
+        fields = [(field.name, bytes(field)) for field in record]
+        assert fields == [(field.name, bytes(field)) for field in record.iter_fields()]
+        assert all(name != 'XXXX' for name, _ in fields)
+        assert sum(len(data) + 6 for _, data in fields) <= len(record.content)
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_navigate_groups(test_file):
+    assert {group.label for group in test_file.top_groups} == test_file.group_labels
+    cell_group = next(group for group in test_file.top_groups if group.label == 'CELL')
+    block = test_file.subgroups(cell_group)[0]
+    assert block.group_type_name == 'Interior Cell Block'
+    sub_block = test_file.subgroups(block)[0]
+    cell = test_file.group_records(sub_block)[0]
+    assert cell.type == 'CELL'
+    references = test_file.children_of(cell)
+    assert references
+    assert all(reference.type in ('REFR', 'ACHR', 'PGRE', 'PHZD', 'NAVM') for reference in references)
+    assert test_file.children_of(cell, recursive=False) == []
+    assert len(test_file.group_records(cell_group, recursive=True)) == len(list(test_file.iter_group('CELL')))
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_lazy_children(test_file):
+    with ElderScrollsFileReader(test_filename, use_mmap=True, lazy_children=True) as lazy_file:
+        assert lazy_file.record_table.pending_groups
+        cell = lazy_file['CELL'][0]
+        assert lazy_file.children_of(cell) == test_file.children_of(cell.form_id)
+        assert lazy_file['0x13bab'] == test_file['0x13bab']
+        assert len(lazy_file) == len(test_file)
+        assert not lazy_file.record_table.pending_groups
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_lazy_children_of_exterior_cell(test_file):
+    table = test_file.record_table
+    exterior_cells = [row for row in table.rows('CELL')
+                      if table.parent_groups[row] >= 0 and table.group_types[table.parent_groups[row]] == 5]
+    assert exterior_cells
+    cell = test_file.record_at(exterior_cells[-1])
+    with ElderScrollsFileReader(test_filename, lazy_children=True) as lazy_file:
+        lazy_table = lazy_file.record_table
+        cell_children_groups = [group for group in lazy_table.pending_groups if lazy_table.group_types[group] == 6]
+        assert lazy_file.children_of(cell.form_id) == test_file.children_of(cell.form_id)
+        # Interior cells come first in the file, but their children groups are not scanned.
+        assert all(group in lazy_table.pending_groups for group in cell_children_groups)
+        assert lazy_file['CELL'] == test_file['CELL']
+        assert 'WRLD' in lazy_file
+        # Only the children group of the cell was scanned, among the Cell Children and Topic Children groups.
+        scanned_children_groups = [group for group in range(len(lazy_table.group_offsets))
+                                   if lazy_table.group_types[group] in (6, 7) and group not in lazy_table.pending_groups]
+        assert scanned_children_groups == [lazy_file.get_children_group(cell.form_id).index]
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_lazy_top_groups(test_file):
+    with ElderScrollsFileReader(test_filename, lazy_top_groups=True) as lazy_file:
+        assert len(lazy_file.record_table) == 1  # Only the TES4 record.
+        assert lazy_file.group_labels == test_file.group_labels
+        assert lazy_file['BOOK'] == test_file['BOOK']
+        scanned_groups = [group.label for group in lazy_file.top_groups
+                          if group.index not in lazy_file.record_table.pending_groups]
+        assert scanned_groups == ['BOOK']
+        assert lazy_file['0x13bab'] == test_file['0x13bab']
+        assert lazy_file.record_types == test_file.record_types
+        assert len(lazy_file) == len(test_file)
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_lazy_index_cache(test_file, tmp_path):
+    with ElderScrollsFileReader(test_filename, cache_folder=str(tmp_path), lazy_top_groups=True) as lazy_file:
+        assert not list(tmp_path.iterdir())
+        assert lazy_file['BOOK'] == test_file['BOOK']
+        assert not list(tmp_path.iterdir())
+        assert len(lazy_file) == len(test_file)
+        assert len(list(tmp_path.iterdir())) == 1  # Saved once all the groups were scanned.
+    with ElderScrollsFileReader(test_filename, cache_folder=str(tmp_path), lazy_children=True) as warm_file:
+        assert not warm_file.record_table.pending_groups
+        assert sorted(warm_file.record_table.offsets) == sorted(test_file.record_table.offsets)
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_load_order():
+    update_filename = os.path.join(os.path.dirname(test_filename), 'Update.esm')
+    with LoadOrder([test_filename, update_filename]) as load_order:
+        assert load_order.plugin_names == ['Skyrim.esm', 'Update.esm']
+        skyrim_file, update_file = load_order.readers
+        override = next(record for record in update_file['NPC_']
+                        if record.form_id.modindex == 0 and record.form_id in skyrim_file)
+        form_id = int(override.form_id)
+        overrides = load_order.overrides(form_id)
+        assert [reader for reader, _ in overrides] == [skyrim_file, update_file]
+        assert overrides[0][1] == skyrim_file[form_id]
+        assert load_order.winning_override(form_id) == (update_file, override)
+        assert load_order[form_id] == override
+        assert form_id in set(load_order.conflicts())
+        new_record = next(record for record in update_file['NPC_'] if record.form_id.modindex == 1)
+        global_form_id = load_order.global_form_id(update_file, new_record.form_id)
+        assert global_form_id >> 24 == 1
+        assert load_order[global_form_id] == new_record
+        assert len(load_order.overrides(global_form_id)) == 1
+
+    with pytest.raises(RuntimeError):
+        LoadOrder([update_filename])
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_open_many(test_file):
+    update_filename = os.path.join(os.path.dirname(test_filename), 'Update.esm')
+    readers = open_many([test_filename, update_filename], workers=2)
+    try:
+        assert [reader.file_name for reader in readers] == ['Skyrim.esm', 'Update.esm']
+        table, expected_table = readers[0].record_table, test_file.record_table
+        for column in ['form_ids', 'type_codes', 'offsets', 'sizes', 'flags']:
+            assert getattr(table, column) == getattr(expected_table, column)
+        assert readers[0].masters == test_file.masters
+        assert readers[0]['0x13bab'] == test_file['0x13bab']
+        assert readers[1].masters == ['Skyrim.esm']
+    finally:
+        for reader in readers:
+            reader.__exit__(None, None, None)
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_load_order_with_light_plugin():
+    data_folder = os.path.dirname(test_filename)
+    light_filename = os.path.join(data_folder, 'Light.esl')
+    if not os.path.exists(light_filename):
+        pytest.skip('No light plugin to test with.')
+    with LoadOrder([test_filename, os.path.join(data_folder, 'Update.esm'), light_filename]) as load_order:
+        light_file = load_order.readers[-1]
+        assert light_file.is_light
+        assert not load_order.readers[0].is_light
+        new_record = next(record for record in light_file['NPC_']
+                          if record.form_id.modindex == len(light_file.masters))
+        global_form_id = FormId(load_order.global_form_id(light_file, new_record.form_id).to_bytes(4, 'little'))
+        assert global_form_id.is_light
+        assert global_form_id.light_index == 0
+        assert global_form_id.objectindex == new_record.form_id.objectindex
+        assert load_order[int(global_form_id)] == new_record
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_decoded_header(test_file):
+    record = test_file['0x13bab']  # Ysolda
+    assert record.type == 'NPC_'
+    assert record.type is test_file['NPC_'][0].type  # Types are interned.
+    assert record.size == test_file.record_table.sizes[test_file._find_row(record)]
+    assert record.form_id is record.form_id
+    assert record.form_id == 0x13bab
+    test_file.load_record_content(record)
+    npc = NPC(record)
+    assert (npc.type, npc.size, npc.flags, npc.form_id) == (record.type, record.size, record.flags, record.form_id)
+    assert npc.is_compressed == record.is_compressed == bool(record.flags & (1 << 18))
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_iter_records(test_file):
+    records = list(iter_records(test_filename, types=['BOOK', 'NPC_']))
+    assert records == test_file['BOOK'] + test_file['NPC_']
+    test_file.load_record_contents(records[:10])
+    for record in records[:10]:
+        assert record.content == test_file.get_record_content(record)
+    assert sum(1 for _ in iter_records(test_filename, with_content=False)) == len(test_file)
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_decode_fields_with_schema(test_file):
+    records = test_file['NPC_'][:500]
+    test_file.load_record_contents(records)
+    ysolda = test_file['0x13bab']
+    test_file.load_record_content(ysolda)
+    npc = NPC(ysolda)
+    acbs = npc.decode('ACBS')
+    assert acbs.flags & 1 == npc.is_female == True
+    assert acbs.level == npc.level
+    assert npc.decode('RNAM').form_id == npc.race_id
+    decoded = decode_fields(records, 'ACBS')
+    assert decoded == [NPC(record).decode('ACBS') for record in records]
+    assert decoded[0].flags == int.from_bytes(records[0].get_first('ACBS')[0:4], 'little')
+    races = test_file['RACE']
+    test_file.load_record_contents(races)
+    for race, data in zip(races, decode_fields(races, 'DATA')):
+        assert Race(race).male_height == data.male_height > 0
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_to_columns(test_file):
+    pytest.importorskip('numpy')
+    columns = test_file.to_columns('NPC_', fields=['EDID', 'ACBS'])
+    records = test_file['NPC_']
+    assert len(columns['form_id']) == len(records)
+    assert columns['form_id'].tolist() == [int(record.form_id) for record in records]
+    assert b'Ysolda\0' in columns['EDID'].tolist()
+    assert columns['has_ACBS'].all()
+    test_file.load_record_contents(records[:10])
+    for record, acbs in zip(records[:10], columns['ACBS'][:10]):
+        assert acbs['level'] == NPC(record).decode('ACBS').level
+        assert acbs['flags'] == NPC(record).decode('ACBS').flags
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_to_columns_as_arrow(test_file):
+    pytest.importorskip('pyarrow')
+    arrow_table = test_file.to_columns('RACE', fields=['DATA'], arrow=True)
+    columns = test_file.to_columns('RACE', fields=['DATA'])
+    assert arrow_table.num_rows == len(test_file['RACE'])
+    assert arrow_table.column('DATA.male_height').to_pylist() == columns['DATA']['male_height'].tolist()
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_to_columns_keeps_trailing_zero_bytes(test_file):
+    pytest.importorskip('numpy')
+    columns = test_file.to_columns('NPC_', fields=['EDID'])
+    records = test_file['NPC_']
+    test_file.load_record_contents(records)
+    editor_ids = [bytes(record.get_first('EDID')) for record in records]
+    assert all(editor_id.endswith(b'\0') for editor_id in editor_ids)
+    assert columns['EDID'].tolist() == editor_ids
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_query(test_file):
+    npcs = test_file['NPC_']
+    test_file.load_record_contents(npcs)
+    essential = [npc for npc in npcs if NPC(npc).is_essential]
+    query = test_file.query('NPC_').where_field('ACBS', lambda acbs: acbs.flags & 2)
+    assert list(query.run(batch_size=100)) == essential
+    compressed = test_file.query('NPC_').with_flag(18)
+    assert list(compressed) == [npc for npc in npcs if npc.is_compressed]
+    assert test_file.query('NPC_').without_flag(18).count() == len(npcs) - len(list(compressed))
+    query = test_file.query('NPC_').form_id_range(0x13000, '0x13fff').editor_id_startswith('Ysol')
+    assert [npc.editor_id for npc in query] == ['Ysolda']
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_query_loads_only_matching_contents():
+    with ElderScrollsFileReader(test_filename) as reader:
+        query = reader.query().where(lambda record: record.type == 'BOOK')
+        books = list(query)
+        assert books == reader['BOOK']
+        assert set(reader._contents) == {0} | {reader._find_row(book) for book in books}
+
+@pytest.mark.depends(on=['test_open_file'])
+def test_editor_id_index(tmp_path):
+    # Building the index changes the reader, so this test does not use the shared test_file.
+    with ElderScrollsFileReader(test_filename) as elder_scrolls_file:
+        ysolda = elder_scrolls_file.by_editor_id('Ysolda')
+        assert ysolda == elder_scrolls_file['0x13bab']
+        assert elder_scrolls_file.by_editor_id('ysolda') == ysolda
+        with pytest.raises(KeyError):
+            elder_scrolls_file.by_editor_id('NotAnEditorId')
+        books = elder_scrolls_file['BOOK']
+        elder_scrolls_file.load_record_contents(books)
+        book_ids = sorted(book.editor_id for book in books if book.editor_id.lower().startswith('book'))
+        assert [book.editor_id for book in elder_scrolls_file.search_editor_ids('Book')] == book_ids
+        assert ysolda in elder_scrolls_file.search_editor_ids(substring='SOLD')
+    with ElderScrollsFileReader(test_filename, cache_folder=str(tmp_path), editor_id_index=True) as reader:
+        assert reader.record_table.has_editor_ids
+    with ElderScrollsFileReader(test_filename, cache_folder=str(tmp_path)) as reader:
+        assert reader.record_table.has_editor_ids  # Loaded from the cache.
+        assert reader.by_editor_id('Ysolda') == ysolda